@@ -4,12 +4,29 @@
 
 from dash import Dash
 import dash_bootstrap_components as dbc
+import orjson
+import plotly.io as pio
+from flask.json.provider import DefaultJSONProvider
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that parses request bodies (callback inputs and stores) with orjson."""
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+# Callback responses are serialized by Plotly's JSON encoder
+pio.json.config.default_engine = "orjson"
 
 # Initialize the Dash app with Bootstrap
 app = Dash(__name__, 
         external_stylesheets=[dbc.themes.BOOTSTRAP],
         suppress_callback_exceptions=True,
+        # Skip the "Updating..." document title rewrites on every callback
+        update_title=None,
         meta_tags=[{"name": "viewport", "content": "width=device-width, initial-scale=1"}])
 
 server = app.server
+server.json = ORJSONProvider(server)
 app.title = "Position Data Analyser"
\ No newline at end of file
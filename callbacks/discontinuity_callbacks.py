@@ -2,17 +2,32 @@
 
 import dash
 from dash import html, dcc, Input, Output, State, callback_context
-import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import json
-import base64
+import orjson
 from datetime import datetime
-from scipy import interpolate
-import copy
+from collections import OrderedDict
+import threading
 
-from utils.data_processing import get_data_summary
+from utils.data_processing import get_data_summary, get_soa, from_soa, data_fingerprint
+
+# Options for the animal selection checklist
+_ANIMAL_OPTIONS = [{"label": f"Animal {i+1}", "value": i, "disabled": False} for i in range(10)]
+
+# Tolerance for comparing positions and confidences, as in np.isclose
+_ATOL = 1e-6
+_RTOL = 1e-9
+
+# Marker styles shared by the preview plot traces
+_ORIGINAL_MARKER = dict(size=6, color='blue')
+_FIXED_MARKER = dict(size=8, color='red', symbol='diamond')
+
+# Summary and discontinuity count per raw data version, see update_discontinuity_panel()
+# (guarded by its lock, as callbacks can run in several threads)
+_PANEL_STATS = OrderedDict()
+_PANEL_STATS_SIZE = 4
+_PANEL_STATS_LOCK = threading.Lock()
 
 def register_discontinuity_callbacks(app):
     """Register callbacks for the discontinuity removal step."""
@@ -24,17 +39,41 @@ def register_discontinuity_callbacks(app):
             Output("discontinuity-preview-plot", "figure"),
         ],
         [Input("workflow-tabs", "active_tab")],
-        [State("stored-raw-data", "data")]
+        [
+            State("stored-raw-data", "data"),
+            State("stored-raw-data", "modified_timestamp")
+        ]
     )
-    def update_discontinuity_panel(active_tab, raw_data):
+    def update_discontinuity_panel(active_tab, raw_data, raw_timestamp):
         """Update the discontinuity panel with data from the imported JSON."""
         if active_tab != "tab-discontinuity" or not raw_data:
             empty_fig = go.Figure()
             empty_fig.update_layout(title="No data to display")
             return "Import data first", "No data to display", empty_fig
         
-        # Get data summary
-        summary = get_data_summary(raw_data)
+        # The stats only change when the raw data does, so re-entering the tab
+        # reuses them
+        stats_key = (raw_timestamp, data_fingerprint(raw_data))
+        stats = None
+        if raw_timestamp is not None:
+            with _PANEL_STATS_LOCK:
+                stats = _PANEL_STATS.get(stats_key)
+                if stats is not None:
+                    _PANEL_STATS.move_to_end(stats_key)
+        if stats is not None:
+            summary, num_discontinuities = stats
+        else:
+            # Convert once; reused by the helpers below and by later callbacks
+            get_soa(raw_data, cache_key=("stored-raw-data", raw_timestamp))
+            
+            summary = get_data_summary(raw_data)
+            num_discontinuities = len(detect_discontinuities(raw_data))
+            
+            if raw_timestamp is not None:
+                with _PANEL_STATS_LOCK:
+                    _PANEL_STATS[stats_key] = (summary, num_discontinuities)
+                    while len(_PANEL_STATS) > _PANEL_STATS_SIZE:
+                        _PANEL_STATS.popitem(last=False)
         
         # Create data summary display
         summary_html = html.Div([
@@ -43,11 +82,8 @@ def register_discontinuity_callbacks(app):
             html.P(f"Body Parts Available: {len(summary.get('bodyparts', []))}", className="mb-1"),
         ])
         
-        # Calculate initial discontinuities
-        discontinuities = detect_discontinuities(raw_data)
-        
         preview_text = html.Div([
-            html.P(f"Detected {len(discontinuities)} potential discontinuities.", className="mb-1"),
+            html.P(f"Detected {num_discontinuities} potential discontinuities.", className="mb-1"),
             html.P("Use the settings on the left to fix these issues.", className="mb-1"),
         ])
         
@@ -66,6 +102,7 @@ def register_discontinuity_callbacks(app):
             Output("discontinuity-preview-plot", "figure", allow_duplicate=True),
             Output("discontinuity-preview", "children", allow_duplicate=True),
             Output("stored-processed-data", "data"),
+            Output("has-processed-data", "data"),
             Output("proceed-to-zones-btn-discontinuity", "disabled")
         ],
         [Input("fix-discontinuities-btn", "n_clicks")],
@@ -74,32 +111,35 @@ def register_discontinuity_callbacks(app):
             State("interpolation-method", "value"),
             State("max-gap-slider", "value"),
             State("animal-selection-checklist", "value"),
-            State("interpolation-confidence-input", "value")  # Add this new state
+            State("interpolation-confidence-input", "value"),  # Add this new state
+            State("stored-raw-data", "modified_timestamp")
         ],
         prevent_initial_call=True
     )
-    def fix_dis_discontinuities(n_clicks, raw_data, method, max_gap, selected_animals, interp_confidence):
+    def fix_dis_discontinuities(n_clicks, raw_data, method, max_gap, selected_animals, interp_confidence, raw_timestamp):
         """Fix discontinuities in the data based on user settings and selected animals."""
         if n_clicks is None or not raw_data:
             raise dash.exceptions.PreventUpdate
+        
+        # Convert once; reused by the helpers below
+        get_soa(raw_data, cache_key=("stored-raw-data", raw_timestamp))
             
         # Use default value if input is invalid
         if interp_confidence is None or not (0 <= interp_confidence <= 1):
             interp_confidence = 0.51
             
-        # Detect discontinuities in the data (only for selected animals)
-        discontinuities = detect_discontinuities(raw_data, selected_animals)
-        
-        # Fix discontinuities based on chosen method and confidence
-        processed_data, fixed_count_discontinuities, max_gap_found = fix_data_discontinuities(
-            raw_data, discontinuities, method, max_gap, interp_confidence
+        # Detect discontinuities in the data (only for selected animals) and fix
+        # them based on chosen method and confidence
+        processed_data, discontinuities, fixed_count_discontinuities, max_gap_found = detect_and_fix_discontinuities(
+            raw_data, selected_animals, method, max_gap, interp_confidence
         )
         
-        # Store interpolation confidence in metadata for future reference
+        # Store interpolation confidence and fix count in metadata for future reference
         if isinstance(processed_data, dict) and 'metadata' in processed_data:
             processed_data['metadata']['interp_confidence'] = interp_confidence
+            processed_data['metadata']['fixed_count'] = fixed_count_discontinuities
         elif isinstance(processed_data, dict):
-            processed_data['metadata'] = {'interp_confidence': interp_confidence}
+            processed_data['metadata'] = {'interp_confidence': interp_confidence, 'fixed_count': fixed_count_discontinuities}
         
         # Create preview plot of original vs. processed data
         # Pick the first selected animal for demonstration
@@ -113,66 +153,41 @@ def register_discontinuity_callbacks(app):
         # Extract original data with gaps
         x_orig, y_orig, frames = extract_trajectory(raw_data, animal_idx, bodypart_idx)
         
-        # Only extract fixed points if there are actual discontinuities
-        x_fixed = []
-        y_fixed = []
-        frames_fixed = []
+        # Only extract fixed points if discontinuities were actually fixed
+        x_fixed = y_fixed = frames_fixed = np.array([])
         
         # Extract interpolated points, passing the custom confidence value
-        if discontinuities:
+        if discontinuities and fixed_count_discontinuities > 0:
             x_fixed, y_fixed, frames_fixed = extract_fixed_points(
                 raw_data, processed_data, animal_idx, bodypart_idx, interp_confidence
             )
         
-        # Plot X trajectory - Original data as blue points
-        fig.add_trace(
-            go.Scatter(
-                x=frames, 
-                y=x_orig, 
-                mode='markers', 
-                name='Original X', 
-                marker=dict(size=6, color='blue')
-            ),
-            row=1, col=1
-        )
-        
-        # Only plot interpolated points if we found discontinuities
-        if discontinuities and x_fixed:
-            fig.add_trace(
-                go.Scatter(
-                    x=frames_fixed, 
-                    y=x_fixed, 
-                    mode='markers', 
-                    name='Interpolated X', 
-                    marker=dict(size=8, color='red', symbol='diamond')
-                ),
-                row=1, col=1
-            )
-        
-        # Plot Y trajectory - Original data as blue points
-        fig.add_trace(
-            go.Scatter(
-                x=frames, 
-                y=y_orig, 
-                mode='markers', 
-                name='Original Y', 
-                marker=dict(size=6, color='blue')
-            ),
-            row=2, col=1
-        )
-        
-        # Only plot interpolated points if we found discontinuities
-        if discontinuities and y_fixed:
+        # Plot X and Y trajectories - original data as blue points, interpolated
+        # points (only if we found discontinuities) as red diamonds. The arrays
+        # are passed to Plotly as they are, without building lists.
+        for row, axis, orig_values, fixed_values in ((1, 'X', x_orig, x_fixed), (2, 'Y', y_orig, y_fixed)):
             fig.add_trace(
                 go.Scatter(
-                    x=frames_fixed, 
-                    y=y_fixed, 
+                    x=frames, 
+                    y=orig_values, 
                     mode='markers', 
-                    name='Interpolated Y', 
-                    marker=dict(size=8, color='red', symbol='diamond')
+                    name=f'Original {axis}', 
+                    marker=_ORIGINAL_MARKER
                 ),
-                row=2, col=1
+                row=row, col=1
             )
+            
+            if discontinuities and len(fixed_values) > 0:
+                fig.add_trace(
+                    go.Scatter(
+                        x=frames_fixed, 
+                        y=fixed_values, 
+                        mode='markers', 
+                        name=f'Interpolated {axis}', 
+                        marker=_FIXED_MARKER
+                    ),
+                    row=row, col=1
+                )
         
         # Update layout with better visibility for scatter points
         fig.update_layout(
@@ -181,9 +196,6 @@ def register_discontinuity_callbacks(app):
             legend=dict(orientation="v", yanchor="bottom", y=1.02, xanchor="right", x=1)
         )
         
-        # Count previously interpolated points
-        fixed_points_count = count_fixed_points(raw_data, processed_data)
-        
         # Create summary text with more detailed information
         preview_text = html.Div([
             html.P(f"Detected {len(discontinuities)} discontinuities in {len(selected_animals)} selected animals.", className="mb-1"),
@@ -191,19 +203,20 @@ def register_discontinuity_callbacks(app):
             html.P(f"Maximum gap found: {max_gap_found} frames (limit set to: {max_gap} frames)", className="mb-1")
         ])
         
-        # Return the figure, preview text, processed data, and enable the proceed button
-        return fig, preview_text, processed_data, False
+        # Return the figure, preview text, processed data (and its flag), and enable the proceed button
+        return fig, preview_text, processed_data, bool(processed_data), False
     
     # Add callback for the "Proceed to Zones" button
     @app.callback(
         Output("workflow-tabs", "active_tab", allow_duplicate=True),
         [Input("proceed-to-zones-btn-discontinuity", "n_clicks")],
-        [State("stored-processed-data", "data")],
+        [State("has-processed-data", "data")],
         prevent_initial_call=True
     )
-    def proceed_to_zones(n_clicks, processed_data):
+    def proceed_to_zones(n_clicks, has_processed_data):
         """Proceed to the filter tab when the button is clicked."""
-        if n_clicks is None or not processed_data:
+        # The flag avoids sending the processed data itself
+        if n_clicks is None or not has_processed_data:
             raise dash.exceptions.PreventUpdate
         return "tab-zones"
     
@@ -218,33 +231,35 @@ def register_discontinuity_callbacks(app):
         if n_clicks is None or not processed_data:
             raise dash.exceptions.PreventUpdate
             
-        # Create a deep copy to avoid modifying the stored data
-        export_data = copy.deepcopy(processed_data)
-        
         # Get the metadata to see if we stored the interpolation confidence
         interp_confidence = 0.51  # Default value to look for
-        if isinstance(export_data, dict) and 'metadata' in export_data:
-            interp_confidence = export_data['metadata'].get('interp_confidence', 0.51)
-        
-        # Normalize all confidence values - treat interpolated points as regular points
-        if isinstance(export_data, dict) and 'data' in export_data:
-            frames = export_data['data']
-            for frame in frames:
-                if 'bodyparts' in frame:
-                    for animal_data in frame['bodyparts']:
-                        for i in range(len(animal_data)):
-                            x, y, conf = animal_data[i]
-                            # Convert interpolated confidence value to regular confidence (1.0)
-                            if abs(conf - interp_confidence) < 1e-6:
-                                animal_data[i] = [x, y, 1.0]
+        if isinstance(processed_data, dict) and 'metadata' in processed_data:
+            interp_confidence = processed_data['metadata'].get('interp_confidence', 0.51)
+        
+        # Normalize all confidence values - treat interpolated points as regular points.
+        # The frames are rebuilt from the arrays, leaving the stored data untouched.
+        # The stacked copy is the only full-size array; the confidences are
+        # normalized in place inside it.
+        bodyparts = np.stack(get_soa(processed_data), axis=-1)
+        confidences = bodyparts[..., 2]
+        confidences[_is_close(confidences, interp_confidence)] = 1.0
+        
+        # orjson writes the per-frame arrays directly (NaN as null)
+        if isinstance(processed_data, dict) and 'data' in processed_data:
+            export_frames = [dict(frame, bodyparts=bp) for frame, bp in zip(processed_data['data'], bodyparts)]
+            export_data = dict(processed_data, data=export_frames)
+        else:
+            export_data = [dict(frame, bodyparts=bp) for frame, bp in zip(processed_data, bodyparts)]
         
         # Create filename with date/time
         now = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"processed_data_{now}.json"
         
-        # Return as downloadable JSON file
+        # Return as downloadable JSON file. The response itself is JSON, so the
+        # file has to go out as a string; base64 content (dcc.send_bytes) would
+        # only make that string a third larger.
         return dict(
-            content=json.dumps(export_data, indent=2),
+            content=orjson.dumps(export_data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).decode(),
             filename=filename,
             type="application/json"
         )
@@ -252,32 +267,16 @@ def register_discontinuity_callbacks(app):
     @app.callback(
         Output("animal-selection-checklist", "options"),
         [Input("workflow-tabs", "active_tab")],
-        [State("stored-raw-data", "data")]
+        [State("animal-selection-checklist", "options")]
     )
-    def update_animal_options(active_tab, raw_data):
+    def update_animal_options(active_tab, current_options):
         """Update the animal selection options based on imported data."""
-        if active_tab != "tab-discontinuity" or not raw_data:
-            # Default options when no data - all enabled but will show warning
-            return [{"label": f"Animal {i+1}", "value": i, "disabled": False} for i in range(10)]
-        
-        # Count actual animals in the data
-        num_animals = 0
-        if isinstance(raw_data, dict) and 'data' in raw_data and len(raw_data['data']) > 0:
-            if 'bodyparts' in raw_data['data'][0]:
-                num_animals = len(raw_data['data'][0]['bodyparts'])
-        
-        # Create options with all animals enabled
-        options = []
-        for i in range(10):
-            # Add an indicator for real animals but don't disable any options
-            if i < num_animals:
-                # For animals that exist in the data
-                options.append({"label": f"Animal {i+1}", "value": i, "disabled": False})
-            else:
-                # For animals that don't exist in the data
-                options.append({"label": f"Animal {i+1}", "value": i, "disabled": False})
-        
-        return options
+        # All animals stay enabled whether or not they exist in the data, so the
+        # options only need to be sent when they differ from the current ones.
+        # Returning no_update also avoids re-triggering the default selection.
+        if current_options == _ANIMAL_OPTIONS:
+            return dash.no_update
+        return _ANIMAL_OPTIONS
 
     @app.callback(
         Output("animal-selection-checklist", "value"),
@@ -295,157 +294,163 @@ def register_discontinuity_callbacks(app):
         
 
 
-def detect_discontinuities(data, selected_animals=None):
+def _is_close(a, b):
+    """Elementwise |a - b| <= atol + rtol * |b|; NaN is never close."""
+    return np.abs(a - b) <= _ATOL + _RTOL * np.abs(b)
+
+
+def _differs(a, b):
+    """Elementwise |a - b| > atol + rtol * |b|; NaN never differs."""
+    return np.abs(a - b) > _ATOL + _RTOL * np.abs(b)
+
+
+def _find_runs(mask):
     """
-    Detect discontinuities in the tracking data for selected animals only.
-    Returns a list of discontinuities with format:
-    [(animal_idx, bodypart_idx, start_frame, end_frame), ...]
-    
-    Special handling: if any bodypart has confidence = -1, the entire frame 
-    is considered discontinuous for that animal and counted only once.
+    Find runs of True values along the first axis of a boolean mask.
+    Returns (columns, starts, ends) with inclusive ends, ordered by column
+    and then by start. A 1-D mask is treated as a single column.
+    """
+    if mask.ndim == 1:
+        mask = mask[:, np.newaxis]
+    padded = np.zeros((mask.shape[0] + 2, mask.shape[1]), dtype=bool)
+    padded[1:-1] = mask
+    # Value changes alternate between run starts and run ends in each column
+    columns, edges = np.nonzero((padded[1:] != padded[:-1]).T)
+    return columns[0::2], edges[0::2], edges[1::2] - 1
+
+
+def _discontinuity_masks(X, Y, C):
+    """
+    Masks shared by detection and fixing: frame_bad (frames, animals) marks
+    frames where any bodypart has confidence = -1, nan_mask (frames,
+    animals, bodyparts) marks NaN positions.
     """
+    return (C == -1).any(axis=2), np.isnan(X) | np.isnan(Y)
+
+
+def _detect_discontinuities(frame_bad, nan_mask, selected_animals=None):
+    """Detect discontinuities from the masks of _discontinuity_masks()."""
     discontinuities = []
-    
-    # Extract actual data from data wrapper if needed
-    if isinstance(data, dict) and 'data' in data:
-        frames = data['data']
-    else:
-        frames = data
+    num_frames, num_animals = frame_bad.shape
     
     # If no data, return empty list
-    if not frames or not isinstance(frames, list) or len(frames) == 0:
+    if num_frames == 0:
         return discontinuities
     
-    # Go through each animal and bodypart
-    num_animals = 0
-    num_bodyparts = 0
-    
-    # Determine structure
-    if 'bodyparts' in frames[0]:
-        bodyparts_data = frames[0]['bodyparts']
-        num_animals = len(bodyparts_data)
-        if num_animals > 0:
-            num_bodyparts = len(bodyparts_data[0])
-    
     # Default to all animals if none selected
     if selected_animals is None or len(selected_animals) == 0:
         selected_animals = list(range(num_animals))
     
-    # For each selected animal, detect frame-level discontinuities
     for animal_idx in selected_animals:
         if animal_idx >= num_animals:
             continue
-            
-        # Track frame-level discontinuities for this animal
-        current_frame_gap = None
-        frame_level_discontinuities = []
-        
-        # First pass: identify frames where entire animal data is discontinuous (any bodypart has conf = -1)
-        for frame_idx, frame in enumerate(frames):
-            if 'bodyparts' not in frame or len(frame['bodyparts']) <= animal_idx:
-                continue
-                
-            animal_data = frame['bodyparts'][animal_idx]
-            
-            # Check if any bodypart has confidence = -1, indicating entire frame discontinuity
-            frame_is_discontinuous = False
-            for bodypart_idx in range(min(num_bodyparts, len(animal_data))):
-                if bodypart_idx < len(animal_data):
-                    x, y, conf = animal_data[bodypart_idx]
-                    if conf == -1:
-                        frame_is_discontinuous = True
-                        break
-            
-            if frame_is_discontinuous:
-                # Start a new frame-level gap if not already in one
-                if current_frame_gap is None:
-                    current_frame_gap = (animal_idx, -1, frame_idx, frame_idx)  # Use -1 to indicate frame-level
-            else:
-                # End the current frame-level gap if we were in one
-                if current_frame_gap is not None:
-                    animal, _, start, _ = current_frame_gap
-                    frame_level_discontinuities.append((animal, -1, start, frame_idx - 1))
-                    current_frame_gap = None
-        
-        # Handle case where frame-level gap extends to the end
-        if current_frame_gap is not None:
-            animal, _, start, _ = current_frame_gap
-            frame_level_discontinuities.append((animal, -1, start, len(frames) - 1))
-        
-        # Add frame-level discontinuities to main list
-        discontinuities.extend(frame_level_discontinuities)
-            
-        # For each bodypart, detect normal discontinuities (but skip frames marked as frame-level discontinuous)
-        frame_level_disc_frames = set()
-        for _, _, start, end in frame_level_discontinuities:
-            for f in range(start, end + 1):
-                frame_level_disc_frames.add(f)
-        
-        for bodypart_idx in range(num_bodyparts):
-            current_gap = None
-            
-            for frame_idx, frame in enumerate(frames):
-                # Skip frames already counted as frame-level discontinuous
-                if frame_idx in frame_level_disc_frames:
-                    continue
-                    
-                if 'bodyparts' not in frame or len(frame['bodyparts']) <= animal_idx:
-                    continue
-                    
-                animal_data = frame['bodyparts'][animal_idx]
-                if len(animal_data) <= bodypart_idx:
-                    continue
-                
-                # Get position and confidence
-                x, y, conf = animal_data[bodypart_idx]
-                
-                # For non-frame-level discontinuities, only check for NaN values (conf = -1 already handled above)
-                is_discontinuity = np.isnan(x) or np.isnan(y)
-                
-                if is_discontinuity:
-                    # Start a new gap if not already in one
-                    if current_gap is None:
-                        current_gap = (animal_idx, bodypart_idx, frame_idx, frame_idx)
-                else:
-                    # End the current gap if we were in one
-                    if current_gap is not None:
-                        animal, bodypart, start, _ = current_gap
-                        discontinuities.append((animal, bodypart, start, frame_idx - 1))
-                        current_gap = None
-            
-            # Handle case where gap extends to the end of the sequence
-            if current_gap is not None:
-                animal, bodypart, start, _ = current_gap
-                discontinuities.append((animal, bodypart, start, len(frames) - 1))
+        
+        # Frame-level discontinuities (bodypart_idx = -1)
+        _, starts, ends = _find_runs(frame_bad[:, animal_idx])
+        for start, end in zip(starts, ends):
+            discontinuities.append((animal_idx, -1, int(start), int(end)))
+        
+        # Bodypart discontinuities (NaN positions), skipping frames already counted
+        # as frame-level. Runs are found on the remaining frames, so a gap continues
+        # across any frame-level gap it touches and ends just before the next valid frame.
+        kept_frames = np.flatnonzero(~frame_bad[:, animal_idx])
+        bodyparts, starts, ends = _find_runs(nan_mask[kept_frames, animal_idx])
+        next_valid = np.append(kept_frames, num_frames)[ends + 1]
+        for bodypart_idx, start, after in zip(bodyparts, kept_frames[starts], next_valid):
+            discontinuities.append((animal_idx, int(bodypart_idx), int(start), int(after) - 1))
     
     return discontinuities
 
 
+def detect_discontinuities(data, selected_animals=None):
+    """
+    Detect discontinuities in the tracking data for selected animals only.
+    Returns a list of discontinuities with format:
+    [(animal_idx, bodypart_idx, start_frame, end_frame), ...]
+    
+    Special handling: if any bodypart has confidence = -1, the entire frame 
+    is considered discontinuous for that animal and counted only once.
+    """
+    frame_bad, nan_mask = _discontinuity_masks(*get_soa(data))
+    return _detect_discontinuities(frame_bad, nan_mask, selected_animals)
+
+
+def detect_and_fix_discontinuities(data, selected_animals=None, method="linear", max_gap=10, interp_confidence=0.51):
+    """
+    Detect and fix discontinuities in one call, sharing the array conversion
+    between both steps. Returns (processed_data, discontinuities,
+    fixed_discontinuities, max_gap_found); see detect_discontinuities and
+    fix_data_discontinuities.
+    """
+    discontinuities = detect_discontinuities(data, selected_animals)
+    processed_data, fixed_discontinuities, max_gap_found = fix_data_discontinuities(
+        data, discontinuities, method, max_gap, interp_confidence
+    )
+    return processed_data, discontinuities, fixed_discontinuities, max_gap_found
+
+
+def _find_anchors(X, Y, C, animal_idx, bodyparts, frame, step):
+    """
+    For each bodypart, find the nearest valid point (not NaN and confidence
+    != -1) of the animal from frame on, going back (step -1) or forward
+    (step 1). Returns the frame of each anchor, or -1 where there is none.
+    """
+    num_frames = C.shape[0]
+    if not 0 <= frame < num_frames:
+        return np.full(len(bodyparts), -1)
+    
+    # Anchors are usually right next to the gap
+    valid = ~(np.isnan(X[frame, animal_idx, bodyparts]) | np.isnan(Y[frame, animal_idx, bodyparts]) |
+              (C[frame, animal_idx, bodyparts] == -1))
+    anchors = np.where(valid, frame, -1)
+    pending = np.flatnonzero(~valid)
+    frame += step
+    # Search the remaining bodyparts in windows that double in size
+    size = 16
+    while len(pending) > 0 and 0 <= frame < num_frames:
+        if step < 0:
+            window = np.arange(frame, max(frame - size, -1), -1)
+        else:
+            window = np.arange(frame, min(frame + size, num_frames))
+        rows, cols = window[:, np.newaxis], bodyparts[pending]
+        valid = ~(np.isnan(X[rows, animal_idx, cols]) | np.isnan(Y[rows, animal_idx, cols]) |
+                  (C[rows, animal_idx, cols] == -1))
+        found = valid.any(axis=0)
+        anchors[pending[found]] = window[valid.argmax(axis=0)[found]]
+        pending = pending[~found]
+        frame = window[-1] + step
+        size *= 2
+    return anchors
+
+
 def fix_data_discontinuities(data, discontinuities, method="linear", max_gap=10, interp_confidence=0.51):
     """
     Fix discontinuities in the data using the specified interpolation method.
     Only interpolates frames where original data is missing or has low confidence.
     Returns the processed data and stats about fixed discontinuities.
     
+    Each gap is filled between the nearest valid points (not NaN and
+    confidence != -1) before and after it. Frame-level gaps are fixed first,
+    in order, so their anchors include points filled for earlier gaps;
+    bodypart gaps (as returned by detect_discontinuities) then anchor on
+    those fixes and are all interpolated in one vectorized step.
+    
     Parameters:
     -----------
     interp_confidence : float
         The confidence value to assign to interpolated points (default: 0.51)
     """
-    # Create a deep copy of the data to avoid modifying the original
-    if isinstance(data, dict) and 'data' in data:
-        processed_data = {
-            'data': [frame.copy() for frame in data['data']],
-            'metadata': data.get('metadata', {}).copy()
-        }
-        frames = processed_data['data']
-    else:
-        processed_data = [frame.copy() for frame in data]
-        frames = processed_data
+    X0, Y0, C0 = get_soa(data)
+    num_frames, num_animals, num_bodyparts = C0.shape
+    
+    # Work on a copy so the original data (and its cached arrays) stay untouched.
+    # A single stacked buffer costs one allocation instead of three.
+    X, Y, C = np.stack([X0, Y0, C0])
     
     # Stats tracking
     fixed_discontinuities = 0
     max_gap_found = 0
+    bodypart_gaps = []
     
     # Process each discontinuity
     for animal_idx, bodypart_idx, start_frame, end_frame in discontinuities:
@@ -456,297 +461,183 @@ def fix_data_discontinuities(data, discontinuities, method="linear", max_gap=10,
         # Skip if gap is too large
         if gap_size > max_gap:
             continue
-            
-        # Find valid points before and after the gap
+        
+        # Skip if we don't have frames before or after the gap
         before_frame = start_frame - 1
         after_frame = end_frame + 1
+        if before_frame < 0 or after_frame >= num_frames or animal_idx >= num_animals:
+            continue
         
-        # Skip if we don't have valid points before or after
-        if before_frame < 0 or after_frame >= len(frames):
+        if bodypart_idx != -1:
+            bodypart_gaps.append((animal_idx, bodypart_idx, start_frame, end_frame))
             continue
         
-        # Handle frame-level discontinuity (bodypart_idx = -1)
-        if bodypart_idx == -1:
-            # For frame-level discontinuities, we need to fix all bodyparts in these frames
-            num_bodyparts = 0
-            if ('bodyparts' in frames[0] and 
-                len(frames[0]['bodyparts']) > animal_idx and 
-                len(frames[0]['bodyparts'][animal_idx]) > 0):
-                num_bodyparts = len(frames[0]['bodyparts'][animal_idx])
-            
-            # Fix each bodypart separately within the frame-level discontinuity
-            frame_fixed = False
-            for bp_idx in range(num_bodyparts):
-                # Get positions before and after the gap for this bodypart
-                before_x, before_y = None, None
-                after_x, after_y = None, None
-                
-                # Look for valid data point before gap
-                frame_ptr = before_frame
-                while frame_ptr >= 0:
-                    if ('bodyparts' in frames[frame_ptr] and 
-                        len(frames[frame_ptr]['bodyparts']) > animal_idx and
-                        len(frames[frame_ptr]['bodyparts'][animal_idx]) > bp_idx):
-                        
-                        x, y, conf = frames[frame_ptr]['bodyparts'][animal_idx][bp_idx]
-                        if not (np.isnan(x) or np.isnan(y) or conf == -1):
-                            before_x, before_y = x, y
-                            break
-                    frame_ptr -= 1
-                
-                # Look for valid data point after gap
-                frame_ptr = after_frame
-                while frame_ptr < len(frames):
-                    if ('bodyparts' in frames[frame_ptr] and 
-                        len(frames[frame_ptr]['bodyparts']) > animal_idx and
-                        len(frames[frame_ptr]['bodyparts'][animal_idx]) > bp_idx):
-                        
-                        x, y, conf = frames[frame_ptr]['bodyparts'][animal_idx][bp_idx]
-                        if not (np.isnan(x) or np.isnan(y) or conf == -1):
-                            after_x, after_y = x, y
-                            break
-                    frame_ptr += 1
-                
-                # Skip if we still don't have valid points before or after
-                if before_x is None or after_x is None:
-                    continue
-                
-                # Interpolate each frame in the gap for this bodypart
-                for frame_idx in range(start_frame, end_frame + 1):
-                    if ('bodyparts' not in frames[frame_idx] or 
-                        len(frames[frame_idx]['bodyparts']) <= animal_idx or 
-                        len(frames[frame_idx]['bodyparts'][animal_idx]) <= bp_idx):
-                        continue
-                        
-                    # Calculate interpolated positions
-                    if method == "linear":
-                        # Linear interpolation
-                        total_frames = after_frame - before_frame
-                        progress = (frame_idx - before_frame) / total_frames
-                        
-                        x = before_x + progress * (after_x - before_x)
-                        y = before_y + progress * (after_y - before_y)
-                    else:
-                        # Nearest neighbor or fallback
-                        if frame_idx - before_frame <= after_frame - frame_idx:
-                            x, y = before_x, before_y
-                        else:
-                            x, y = after_x, after_y
-                    
-                    # Update the data with interpolated value
-                    frames[frame_idx]['bodyparts'][animal_idx][bp_idx] = [x, y, interp_confidence]
-                    
-                    # Mark that we fixed something in this frame-level discontinuity
-                    frame_fixed = True
-            
-            # Count as fixed only if at least one bodypart was fixed
-            if frame_fixed:
-                fixed_discontinuities += 1
+        # Frame-level discontinuities (bodypart_idx = -1) fix all bodyparts that
+        # have valid data points before and after the gap
+        bodyparts = np.arange(num_bodyparts)
+        before = _find_anchors(X, Y, C, animal_idx, bodyparts, before_frame, -1)
+        after = _find_anchors(X, Y, C, animal_idx, bodyparts, after_frame, 1)
+        has_anchors = (before >= 0) & (after >= 0)
+        if not has_anchors.any():
+            continue
+        bodyparts, before, after = bodyparts[has_anchors], before[has_anchors], after[has_anchors]
+        before_x, after_x = X[before, animal_idx, bodyparts], X[after, animal_idx, bodyparts]
+        before_y, after_y = Y[before, animal_idx, bodyparts], Y[after, animal_idx, bodyparts]
+        
+        # Interpolate all frames of the gap at once; progress is measured from
+        # the frames next to the gap
+        frames = np.arange(start_frame, end_frame + 1)[:, np.newaxis]
+        if method == "linear":
+            progress = (frames - before_frame) / (after_frame - before_frame)
+            x = before_x + progress * (after_x - before_x)
+            y = before_y + progress * (after_y - before_y)
         else:
-            # Regular bodypart-level discontinuity handling (existing code)
-            # Get positions before and after the gap
-            before_x, before_y = None, None
-            after_x, after_y = None, None
-            
-            # Look for valid data point before gap
-            while before_frame >= 0:
-                if ('bodyparts' in frames[before_frame] and 
-                    len(frames[before_frame]['bodyparts']) > animal_idx and
-                    len(frames[before_frame]['bodyparts'][animal_idx]) > bodypart_idx):
-                    
-                    x, y, conf = frames[before_frame]['bodyparts'][animal_idx][bodypart_idx]
-                    if not (np.isnan(x) or np.isnan(y) or conf == -1):
-                        before_x, before_y = x, y
-                        break
-                before_frame -= 1
-            
-            # Look for valid data point after gap
-            while after_frame < len(frames):
-                if ('bodyparts' in frames[after_frame] and 
-                    len(frames[after_frame]['bodyparts']) > animal_idx and
-                    len(frames[after_frame]['bodyparts'][animal_idx]) > bodypart_idx):
-                    
-                    x, y, conf = frames[after_frame]['bodyparts'][animal_idx][bodypart_idx]
-                    if not (np.isnan(x) or np.isnan(y) or conf == -1):
-                        after_x, after_y = x, y
-                        break
-                after_frame += 1
-            
-            # Skip if we still don't have valid points before or after
-            if before_x is None or after_x is None:
-                continue
-
-            # Interpolate based on the chosen method
-            points_fixed = False  # Track if we actually fixed any points
-            for frame_idx in range(start_frame, end_frame + 1):
-                if ('bodyparts' not in frames[frame_idx] or 
-                    len(frames[frame_idx]['bodyparts']) <= animal_idx or 
-                    len(frames[frame_idx]['bodyparts'][animal_idx]) <= bodypart_idx):
-                    continue
-                    
-                # Get the current data point
-                curr_x, curr_y, curr_conf = frames[frame_idx]['bodyparts'][animal_idx][bodypart_idx]
-                
-                # Only interpolate if original data is invalid (NaN or low confidence)
-                if np.isnan(curr_x) or np.isnan(curr_y) or curr_conf < 0.5:
-                    # Calculate interpolated positions
-                    if method == "linear":
-                        # Linear interpolation
-                        total_frames = after_frame - before_frame
-                        progress = (frame_idx - before_frame) / total_frames
-                        
-                        x = before_x + progress * (after_x - before_x)
-                        y = before_y + progress * (after_y - before_y)
-                    else:
-                        # Nearest neighbor or fallback
-                        if frame_idx - before_frame <= after_frame - frame_idx:
-                            x, y = before_x, before_y
-                        else:
-                            x, y = after_x, after_y
-                    
-                    # Update the data with interpolated value
-                    # Use a confidence value that's distinguishable as interpolated (e.g., 0.51)
-                    frames[frame_idx]['bodyparts'][animal_idx][bodypart_idx] = [x, y, interp_confidence]
-                    points_fixed = True
-                # Otherwise keep the original data (no interpolation needed)
-
-            # Count as fixed only if at least one point was actually fixed
-            if points_fixed:
-                fixed_discontinuities += 1
-            
-    return processed_data, fixed_discontinuities, max_gap_found
-
-
-def extract_trajectory(data, animal_idx, bodypart_idx):
-    """Extract trajectory data for a specific animal and bodypart."""
-    x_values = []
-    y_values = []
-    frame_indices = []
+            # Nearest neighbor or fallback
+            use_before = frames - before_frame <= after_frame - frames
+            x = np.where(use_before, before_x, after_x)
+            y = np.where(use_before, before_y, after_y)
+        
+        X[start_frame:end_frame + 1, animal_idx, bodyparts] = x
+        Y[start_frame:end_frame + 1, animal_idx, bodyparts] = y
+        C[start_frame:end_frame + 1, animal_idx, bodyparts] = interp_confidence
+        fixed_discontinuities += 1
+    
+    # Bodypart discontinuities. Consecutive gaps of a bodypart are separated by
+    # a valid point, so their anchors only depend on the frame-level fixes above
+    # and all of them can be filled at once.
+    gaps = np.array(bodypart_gaps, dtype=np.int64).reshape(-1, 4)
+    frame_numbers = np.arange(num_frames)[:, np.newaxis]
+    for animal_idx in np.unique(gaps[:, 0]):
+        bodyparts, starts, ends = gaps[gaps[:, 0] == animal_idx, 1:].T
+        
+        # Nearest valid frame at or before / at or after each frame
+        valid = ~(np.isnan(X[:, animal_idx]) | np.isnan(Y[:, animal_idx]) | (C[:, animal_idx] == -1))
+        prev_valid = np.maximum.accumulate(np.where(valid, frame_numbers, -1), axis=0)
+        next_valid = np.minimum.accumulate(np.where(valid, frame_numbers, num_frames)[::-1], axis=0)[::-1]
+        before = prev_valid[starts - 1, bodyparts]
+        after = next_valid[ends + 1, bodyparts]
+        has_anchors = (before >= 0) & (after < num_frames)
+        
+        # One entry per frame of each gap that has both anchors
+        sizes = np.where(has_anchors, ends - starts + 1, 0)
+        gap_ids = np.repeat(np.arange(len(sizes)), sizes)
+        frames = starts[gap_ids] + np.arange(len(gap_ids)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        points = (frames, animal_idx, bodyparts[gap_ids])
+        before, after = before[gap_ids], after[gap_ids]
+        before_x, after_x = X[before, animal_idx, points[2]], X[after, animal_idx, points[2]]
+        before_y, after_y = Y[before, animal_idx, points[2]], Y[after, animal_idx, points[2]]
+        
+        if method == "linear":
+            progress = (frames - before) / (after - before)
+            x = before_x + progress * (after_x - before_x)
+            y = before_y + progress * (after_y - before_y)
+        else:
+            # Nearest neighbor or fallback
+            use_before = frames - before <= after - frames
+            x = np.where(use_before, before_x, after_x)
+            y = np.where(use_before, before_y, after_y)
+        
+        # Only interpolate if current data is invalid (NaN or low confidence)
+        with np.errstate(invalid='ignore'):
+            to_fix = np.isnan(X[points]) | np.isnan(Y[points]) | (C[points] < 0.5)
+        fixed_points = tuple(axis[to_fix] if np.ndim(axis) else axis for axis in points)
+        X[fixed_points] = x[to_fix]
+        Y[fixed_points] = y[to_fix]
+        C[fixed_points] = interp_confidence
+        
+        # Count as fixed only if at least one point was actually fixed
+        fixed_discontinuities += len(np.unique(gap_ids[to_fix]))
     
-    # Extract actual data from data wrapper if needed
+    # Rebuild the frame structure from the arrays
     if isinstance(data, dict) and 'data' in data:
         frames = data['data']
     else:
         frames = data
+    processed_frames = from_soa(frames, X, Y, C)
     
-    # Iterate through frames and extract coordinates
-    for frame_idx, frame in enumerate(frames):
-        if 'bodyparts' in frame and len(frame['bodyparts']) > animal_idx:
-            animal_data = frame['bodyparts'][animal_idx]
-            if len(animal_data) > bodypart_idx:
-                x, y, _ = animal_data[bodypart_idx]
-                x_values.append(x)
-                y_values.append(y)
-                frame_indices.append(frame_idx)
+    if isinstance(data, dict) and 'data' in data:
+        processed_data = {
+            'data': processed_frames,
+            'metadata': data.get('metadata', {}).copy()
+        }
+    else:
+        processed_data = processed_frames
     
-    return x_values, y_values, frame_indices
+    return processed_data, fixed_discontinuities, max_gap_found
 
 
-def count_fixed_points(original_data, processed_data):
-    """Count how many data points were fixed by comparing original and processed data."""
-    fixed_count = 0
-    
-    # Get the metadata to see if we stored the interpolation confidence
-    interp_confidence = 0.51  # Default value to look for
-    if isinstance(processed_data, dict) and 'metadata' in processed_data:
-        interp_confidence = processed_data['metadata'].get('interp_confidence', 0.51)
-    
-    # Extract actual data from data wrappers if needed
-    if isinstance(original_data, dict) and 'data' in original_data:
-        original_frames = original_data['data']
-    else:
-        original_frames = original_data
-        
-    if isinstance(processed_data, dict) and 'data' in processed_data:
-        processed_frames = processed_data['data']
-    else:
-        processed_frames = processed_data
+def extract_trajectory(data, animal_idx, bodypart_idx):
+    """Extract trajectory data for a specific animal and bodypart."""
+    X, Y, C = get_soa(data)
+    num_frames, num_animals, num_bodyparts = C.shape
     
-    # Iterate through all frames and compare
-    for frame_idx in range(min(len(original_frames), len(processed_frames))):
-        orig_frame = original_frames[frame_idx]
-        proc_frame = processed_frames[frame_idx]
-        
-        if 'bodyparts' not in orig_frame or 'bodyparts' not in proc_frame:
-            continue
-            
-        for animal_idx in range(min(len(orig_frame['bodyparts']), len(proc_frame['bodyparts']))):
-            orig_animal = orig_frame['bodyparts'][animal_idx]
-            proc_animal = proc_frame['bodyparts'][animal_idx]
-            
-            for bp_idx in range(min(len(orig_animal), len(proc_animal))):
-                orig_x, orig_y, orig_conf = orig_animal[bp_idx]
-                proc_x, proc_y, proc_conf = proc_animal[bp_idx]
-                
-                # Check if point was fixed (values changed and confidence matches interpolation value)
-                if (abs(proc_conf - interp_confidence) < 1e-6 and 
-                    (np.isnan(orig_x) or np.isnan(orig_y) or 
-                    abs(orig_x - proc_x) > 1e-6 or 
-                    abs(orig_y - proc_y) > 1e-6)):
-                    fixed_count += 1
+    if animal_idx >= num_animals or bodypart_idx >= num_bodyparts:
+        return np.array([]), np.array([]), np.array([], dtype=int)
     
-    return fixed_count
+    return X[:, animal_idx, bodypart_idx], Y[:, animal_idx, bodypart_idx], np.arange(num_frames)
+
+
+def _fixed_point_flags(orig_x, orig_y, orig_conf, proc_x, proc_y, proc_conf, interp_confidence):
+    """
+    Per-point comparisons between original and processed data for extract_fixed_points.
+    Returns (orig_is_missing, proc_is_missing, values_changed, is_interpolated),
+    where original points are missing if NaN or of low confidence and
+    values_changed is only set for points present in the original.
+    """
+    proc_is_missing = np.isnan(proc_x) | np.isnan(proc_y)
+    with np.errstate(invalid='ignore'):
+        orig_is_missing = np.isnan(orig_x) | np.isnan(orig_y) | (orig_conf < 0.5)
+        values_changed = ~orig_is_missing & (_differs(orig_x, proc_x) | _differs(orig_y, proc_y))
+        is_interpolated = _is_close(proc_conf, interp_confidence)
+    return orig_is_missing, proc_is_missing, values_changed, is_interpolated
 
 def extract_fixed_points(original_data, processed_data, animal_idx, bodypart_idx, interp_confidence=0.51):
     """
     Extract only the interpolated/fixed points for visualization.
+    Returns (x_values, y_values, frame_indices) as NumPy arrays.
     
     Parameters:
     -----------
     interp_confidence : float
         The confidence value assigned to interpolated points (default: 0.51)
     """
-    x_values = []
-    y_values = []
-    frame_indices = []
-    
-    # Extract actual data from data wrappers if needed
-    if isinstance(original_data, dict) and 'data' in original_data:
-        original_frames = original_data['data']
-    else:
-        original_frames = original_data
-        
+    # Get custom confidence value from metadata if available
     if isinstance(processed_data, dict) and 'data' in processed_data:
-        processed_frames = processed_data['data']
-        # Get custom confidence value from metadata if available
         if 'metadata' in processed_data and 'interp_confidence' in processed_data['metadata']:
             interp_confidence = processed_data['metadata']['interp_confidence']
-    else:
-        processed_frames = processed_data
+        
+        # Nothing to extract if the fix step changed nothing
+        if processed_data.get('metadata', {}).get('fixed_count') == 0:
+            return np.array([]), np.array([]), np.array([], dtype=int)
     
-    # Iterate through frames and extract all fixed/interpolated points
-    for frame_idx in range(min(len(original_frames), len(processed_frames))):
-        if ('bodyparts' in processed_frames[frame_idx] and 
-            len(processed_frames[frame_idx]['bodyparts']) > animal_idx):
-            
-            proc_animal = processed_frames[frame_idx]['bodyparts'][animal_idx]
-            
-            if (len(proc_animal) > bodypart_idx and 
-                'bodyparts' in original_frames[frame_idx] and 
-                len(original_frames[frame_idx]['bodyparts']) > animal_idx and 
-                len(original_frames[frame_idx]['bodyparts'][animal_idx]) > bodypart_idx):
-                
-                # Get original and processed data
-                orig_x, orig_y, orig_conf = original_frames[frame_idx]['bodyparts'][animal_idx][bodypart_idx]
-                proc_x, proc_y, proc_conf = proc_animal[bodypart_idx]
-                
-                # Check if point was interpolated or fixed
-                orig_is_missing = np.isnan(orig_x) or np.isnan(orig_y) or orig_conf < 0.5
-                values_changed = False
-                
-                # If original value existed, check if values changed
-                if not orig_is_missing:
-                    values_changed = (abs(orig_x - proc_x) > 1e-6 or abs(orig_y - proc_y) > 1e-6)
-                
-                # Include point if:
-                # 1. It was interpolated (missing in original but present in processed)
-                # 2. OR if it has the specific interpolated confidence value
-                # 3. OR if it significantly differs from the original value
-                if ((orig_is_missing and not (np.isnan(proc_x) or np.isnan(proc_y))) or 
-                    abs(proc_conf - interp_confidence) < 1e-6 or 
-                    values_changed):
-                    x_values.append(proc_x)
-                    y_values.append(proc_y)
-                    frame_indices.append(frame_idx)
+    # Unprocessed data has no fixed points
+    if processed_data is original_data:
+        return np.array([]), np.array([]), np.array([], dtype=int)
+    
+    X_orig, Y_orig, C_orig = get_soa(original_data)
+    X_proc, Y_proc, C_proc = get_soa(processed_data)
+    
+    # Only frames where both contain the animal and bodypart
+    num_frames = min(len(X_orig), len(X_proc))
+    if min(X_orig.shape[1], X_proc.shape[1]) <= animal_idx or min(X_orig.shape[2], X_proc.shape[2]) <= bodypart_idx:
+        return np.array([]), np.array([]), np.array([], dtype=int)
+    
+    orig_x = X_orig[:num_frames, animal_idx, bodypart_idx]
+    orig_y = Y_orig[:num_frames, animal_idx, bodypart_idx]
+    orig_conf = C_orig[:num_frames, animal_idx, bodypart_idx]
+    proc_x = X_proc[:num_frames, animal_idx, bodypart_idx]
+    proc_y = Y_proc[:num_frames, animal_idx, bodypart_idx]
+    proc_conf = C_proc[:num_frames, animal_idx, bodypart_idx]
+    
+    # Check if point was interpolated or fixed
+    orig_is_missing, proc_is_missing, values_changed, is_interpolated = _fixed_point_flags(
+        orig_x, orig_y, orig_conf, proc_x, proc_y, proc_conf, interp_confidence
+    )
+    
+    # Include point if:
+    # 1. It was interpolated (missing in original but present in processed)
+    # 2. OR if it has the specific interpolated confidence value
+    # 3. OR if it significantly differs from the original value
+    fixed = (orig_is_missing & ~proc_is_missing) | is_interpolated | values_changed
     
-    return x_values, y_values, frame_indices
+    return proc_x[fixed], proc_y[fixed], np.flatnonzero(fixed)
@@ -4,12 +4,96 @@ from dash.dependencies import Input, Output, State, ALL
 from dash import html, dcc, callback_context
 import dash
 import base64
-import json
+import orjson
 import pandas as pd
 import dash_bootstrap_components as dbc
+from collections import OrderedDict
+import functools
+import threading
 
-from utils.data_processing import get_data_summary, filter_data, extract_time_series, add_metadata_to_list
-from utils.plot_utils import create_time_series_plot
+from utils.data_processing import get_data_summary, filter_data, extract_time_series, add_metadata_to_list, data_fingerprint
+from utils.plot_utils import create_time_series_plot, downsample_indices
+
+# Recent summaries and filter results, keyed by the source store, its
+# modified_timestamp and a fingerprint of its data (see _data_version())
+_SUMMARY_CACHE = OrderedDict()
+_FILTER_CACHE = OrderedDict()
+_CACHE_SIZE = 8
+# Guards both caches, as callbacks can run in several threads
+_CACHE_LOCK = threading.Lock()
+
+# Shared props of the bodypart rows in the filter panel
+_ROW_CLASSNAME = "mb-2 pt-2 pb-2 border-bottom"
+_CHECKBOX_COL_CLASSNAME = "d-flex align-items-center justify-content-center"
+_INDEX_STYLE = {"fontWeight": "500"}
+
+def _data_version(processed_data, raw_data, processed_timestamp, raw_timestamp):
+    """Return a key for the data the filter step uses, or None if unknown."""
+    if processed_data is not None:
+        store, data, timestamp = "stored-processed-data", processed_data, processed_timestamp
+    else:
+        store, data, timestamp = "stored-raw-data", raw_data, raw_timestamp
+    if timestamp is None or timestamp < 0:
+        return None
+    return store, timestamp, data_fingerprint(data)
+
+def _cached(cache, key, compute):
+    """Return cache[key], computing and storing it first if missing. A None key is never cached."""
+    if key is None:
+        return compute()
+    with _CACHE_LOCK:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    # Computed outside the lock so other callbacks are not held up
+    value = compute()
+    with _CACHE_LOCK:
+        cache[key] = value
+        while len(cache) > _CACHE_SIZE:
+            cache.popitem(last=False)
+    return value
+
+def _filter_with_summary(data, **filter_args):
+    """Run filter_data() and return the filtered data with its summary."""
+    filtered_data = filter_data(data, **filter_args)
+    return filtered_data, get_data_summary(filtered_data)
+
+@functools.lru_cache(maxsize=4)
+def _bodypart_rows(num_bodyparts):
+    """Header and bodypart rows (name input and checkbox) of the filter panel."""
+    # Create custom bodypart entries with name input and checkbox
+    bodypart_items = [
+        dbc.Row([
+            # Index column
+            dbc.Col(html.Div(f"{bp_idx}", style=_INDEX_STYLE), width=1),
+            # Name input column
+            dbc.Col(
+                dbc.Input(
+                    id={"type": "bodypart-name", "index": bp_idx},
+                    type="text",
+                    value=f"Bodypart {bp_idx}",
+                    placeholder="Enter name"
+                ),
+                width=8
+            ),
+            # Checkbox column
+            dbc.Col(
+                dbc.Checkbox(id={"type": "bodypart-checkbox", "index": bp_idx}, value=True),
+                width=3,
+                className=_CHECKBOX_COL_CLASSNAME
+            )
+        ], className=_ROW_CLASSNAME)
+        for bp_idx in range(num_bodyparts)
+    ]
+    
+    # Header row
+    header_row = dbc.Row([
+        dbc.Col(html.Div("Index", style={"fontWeight": "bold"}), width=1),
+        dbc.Col(html.Div("Name", style={"fontWeight": "bold"}), width=8),
+        dbc.Col(html.Div("Include", style={"fontWeight": "bold"}), width=3, className="text-center")
+    ], className="mb-2 pb-2 border-bottom bg-light")
+    
+    return tuple([header_row] + bodypart_items)
 
 def register_filter_callbacks(app):
     """Register callbacks for the data filtering step."""
@@ -22,10 +106,12 @@ def register_filter_callbacks(app):
         [Input("workflow-tabs", "active_tab")],
         [
             State("stored-processed-data", "data"),
-            State("stored-raw-data", "data")
+            State("stored-raw-data", "data"),
+            State("stored-processed-data", "modified_timestamp"),
+            State("stored-raw-data", "modified_timestamp")
         ]
     )
-    def update_filter_panel(active_tab, processed_data, raw_data):
+    def update_filter_panel(active_tab, processed_data, raw_data, processed_timestamp, raw_timestamp):
         """Update the filter panel with data from the processed JSON (after discontinuity fix)."""
         if active_tab != "tab-filter":
             return "Import data first", []
@@ -35,8 +121,9 @@ def register_filter_callbacks(app):
         if not data_to_use:
             return "Import data first", []
         
-        # Get data summary
-        summary = get_data_summary(data_to_use)
+        # Get data summary (reused while the data is unchanged)
+        version = _data_version(processed_data, raw_data, processed_timestamp, raw_timestamp)
+        summary = _cached(_SUMMARY_CACHE, version, lambda: get_data_summary(data_to_use))
         
         # Create data summary display
         summary_html = html.Div([
@@ -45,47 +132,8 @@ def register_filter_callbacks(app):
             html.P(f"Body Parts Available: {len(summary.get('bodyparts', []))}", className="mb-1"),
         ])
         
-        # Create custom bodypart entries with name input and checkbox
-        bodypart_items = []
-        for bp_idx in range(len(summary.get('bodyparts', []))):
-            bodypart_items.append(
-                dbc.Row([
-                    # Index column
-                    dbc.Col(
-                        html.Div(f"{bp_idx}", style={"fontWeight": "500"}),
-                        width=1
-                    ),
-                    # Name input column
-                    dbc.Col(
-                        dbc.Input(
-                            id={"type": "bodypart-name", "index": bp_idx},
-                            type="text",
-                            value=f"Bodypart {bp_idx}",
-                            placeholder="Enter name"
-                        ),
-                        width=8
-                    ),
-                    # Checkbox column
-                    dbc.Col(
-                        dbc.Checkbox(
-                            id={"type": "bodypart-checkbox", "index": bp_idx},
-                            value=True
-                        ),
-                        width=3,
-                        className="d-flex align-items-center justify-content-center"
-                    )
-                ], 
-                className="mb-2 pt-2 pb-2 border-bottom")
-            )
-        
-        # Header row
-        header_row = dbc.Row([
-            dbc.Col(html.Div("Index", style={"fontWeight": "bold"}), width=1),
-            dbc.Col(html.Div("Name", style={"fontWeight": "bold"}), width=8),
-            dbc.Col(html.Div("Include", style={"fontWeight": "bold"}), width=3, className="text-center")
-        ], className="mb-2 pb-2 border-bottom bg-light")
-        
-        return summary_html, [header_row] + bodypart_items
+        # The rows only depend on the number of bodyparts
+        return summary_html, list(_bodypart_rows(len(summary.get('bodyparts', []))))
 
     # Update the apply_data_filters callback to use the new data format
     @app.callback(
@@ -93,7 +141,8 @@ def register_filter_callbacks(app):
             Output("filter-preview", "children"),
             Output("filter-preview-plot", "figure"),
             Output("stored-filtered-data", "data"),
-            Output("proceed-to-viz-btn", "disabled")
+            Output("proceed-to-viz-btn", "disabled"),
+            Output("applied-filter-key", "data")
         ],
         [Input("apply-filters-btn", "n_clicks")],
         [
@@ -103,38 +152,48 @@ def register_filter_callbacks(app):
             State("confidence-threshold-slider", "value"),
             State("bodyparts-names-store", "data"),
             State("fps-input", "value"),  # Add FPS input state
-            State("workflow-tabs", "active_tab")
+            State("workflow-tabs", "active_tab"),
+            State("stored-processed-data", "modified_timestamp"),
+            State("stored-raw-data", "modified_timestamp"),
+            State("applied-filter-key", "data")
         ]
     )
-    def apply_data_filters(n_clicks, processed_data, raw_data, num_animals, conf_threshold, bodypart_data, fps, active_tab):
+    def apply_data_filters(n_clicks, processed_data, raw_data, num_animals, conf_threshold, bodypart_data, fps, active_tab,
+                           processed_timestamp, raw_timestamp, applied_key):
         """Apply filters to the processed or raw data and show preview."""
         if n_clicks is None or active_tab != "tab-filter":
-            return "Apply filters to see preview", {}, None, True
+            return "Apply filters to see preview", {}, None, True, None
             
         # Use processed data if available, otherwise fall back to raw data
         data_to_use = processed_data if processed_data is not None else raw_data
         if not data_to_use:
-            return "Apply filters to see preview", {}, None, True
+            return "Apply filters to see preview", {}, None, True, None
         
-        # Extract selected body part indices
-        selected_bodyparts = [
-            int(idx) for idx, data in bodypart_data.items() 
-            if data.get("include") == True
-        ]
+        # Extract bodypart names and selected body part indices in one pass
+        selected_bodyparts = []
+        bodypart_names = {}
+        for idx, data in bodypart_data.items():
+            bodypart_names[idx] = data.get("name", f"Bodypart {idx}")
+            if data.get("include") == True:
+                selected_bodyparts.append(int(idx))
         
-        # Extract bodypart names
-        bodypart_names = {
-            idx: data.get("name", f"Bodypart {idx}") 
-            for idx, data in bodypart_data.items()
-        }
+        # Nothing to send back if this browser already holds the result for
+        # the same data and settings
+        version = _data_version(processed_data, raw_data, processed_timestamp, raw_timestamp)
+        applied = None if version is None else [*version, num_animals, conf_threshold, selected_bodyparts, bodypart_data, fps]
+        if applied is not None and applied == applied_key:
+            return (dash.no_update,) * 5
         
-        # Apply filters
-        filtered_data = filter_data(
+        # Apply filters. Results are reused for the same data and parameters;
+        # the metadata dict is copied since it is filled in below.
+        filter_key = None if version is None else (version, num_animals, conf_threshold, tuple(selected_bodyparts))
+        filtered_data, filtered_summary = _cached(_FILTER_CACHE, filter_key, lambda: _filter_with_summary(
             data_to_use, 
             num_animals=num_animals, 
             confidence_threshold=conf_threshold,
             selected_bodyparts=selected_bodyparts
-        )
+        ))
+        filtered_data = dict(filtered_data, metadata=dict(filtered_data.get('metadata', {})))
         
         # Store complete bodypart data and FPS in the filtered data
         if isinstance(filtered_data, dict) and 'metadata' in filtered_data:
@@ -148,8 +207,7 @@ def register_filter_callbacks(app):
             }
         
         # Create preview info
-        original_summary = get_data_summary(data_to_use)
-        filtered_summary = get_data_summary(filtered_data)
+        original_summary = _cached(_SUMMARY_CACHE, version, lambda: get_data_summary(data_to_use))
         
         # Get selected bodypart names for display
         selected_bp_names = [
@@ -173,8 +231,10 @@ def register_filter_callbacks(app):
             bodypart_idx = selected_bodyparts[0] if selected_bodyparts else 0
             bodypart_name = bodypart_names.get(str(bodypart_idx), f"Bodypart {bodypart_idx}")
             
-            # Extract time series and get fps
+            # Extract time series and get fps; the preview only needs enough
+            # points to show the shape of the series
             df, fps = extract_time_series(filtered_data, animal_idx, bodypart_idx)
+            df = df.iloc[downsample_indices(df['x'].to_numpy())]
             
             # Create plot
             figure = create_time_series_plot(
@@ -184,40 +244,45 @@ def register_filter_callbacks(app):
                 fps=fps
             )
         
-        return preview_html, figure, filtered_data, False
+        return preview_html, figure, filtered_data, False, applied
     
     @app.callback(
         Output("workflow-tabs", "active_tab", allow_duplicate=True),
         [Input("proceed-to-viz-btn", "n_clicks")],
-        [State("stored-filtered-data", "data")],
+        [State("proceed-to-viz-btn", "disabled")],
         prevent_initial_call=True
     )
-    def proceed_to_visualization(n_clicks, filtered_data):
+    def proceed_to_visualization(n_clicks, disabled):
         """Proceed to the visualization tab when the button is clicked."""
-        if n_clicks is None or not filtered_data:
+        # The button is only enabled while filtered data is stored
+        if n_clicks is None or disabled:
             return "tab-filter"
         
         return "tab-plot"
     
-    @app.callback(
+    # Synchronize slider and input values in the browser, without a server round trip
+    app.clientside_callback(
+        """
+        function(sliderValue, inputValue) {
+            // Determine which input triggered the callback
+            const triggered = dash_clientside.callback_context.triggered;
+            const triggerId = triggered.length ? triggered[0].prop_id.split('.')[0] : null;
+
+            // Slider to input
+            if (triggerId === "confidence-threshold-slider") {
+                return [sliderValue, sliderValue];
+            }
+            // Input to slider (with constraints)
+            const validValue = (inputValue === null || inputValue === undefined) ? 0.5 : Math.max(0, Math.min(1, inputValue));
+            return [validValue, validValue];
+        }
+        """,
         [Output("confidence-threshold-slider", "value"), 
          Output("confidence-threshold-input", "value")],
         [Input("confidence-threshold-slider", "value"),
          Input("confidence-threshold-input", "value")],
         prevent_initial_call=True
     )
-    def sync_confidence_values(slider_value, input_value):
-        """Synchronize slider and input values without circular dependency."""
-        # Determine which input triggered the callback
-        trigger_id = callback_context.triggered[0]['prop_id'].split('.')[0]
-        
-        # Slider to input
-        if trigger_id == "confidence-threshold-slider":
-            return slider_value, slider_value
-        # Input to slider (with constraints)
-        else:
-            valid_value = 0.5 if input_value is None else max(0, min(1, input_value))
-            return valid_value, valid_value
     
     # Trigger hidden upload component when load button is clicked
     @app.callback(
@@ -240,27 +305,19 @@ def register_filter_callbacks(app):
             Output("bodyparts-names-store", "data", allow_duplicate=True)
         ],
         [Input("upload-config", "contents")],
-        [
-            State("upload-config", "filename"),
-            State("stored-processed-data", "data"),
-            State("stored-raw-data", "data")
-        ],
+        [State("upload-config", "filename")],
         prevent_initial_call=True
     )
-    def load_config_file(contents, filename, processed_data, raw_data):
+    def load_config_file(contents, filename):
         """Load configuration from uploaded JSON file."""
         if contents is None:
             raise dash.exceptions.PreventUpdate
-            
-        # Use processed data if available, otherwise fall back to raw data
-        data_to_use = processed_data if processed_data is not None else raw_data
         
         # Parse the uploaded JSON file
         try:
             content_type, content_string = contents.split(',')
-            decoded = base64.b64decode(content_string).decode('utf-8')
-            
-            config = json.loads(decoded)
+            # orjson parses the decoded bytes directly
+            config = orjson.loads(base64.b64decode(content_string))
             
             # Extract values from config
             num_animals = config.get("num_animals", 2)
@@ -302,7 +359,7 @@ def register_filter_callbacks(app):
         
         # Return as downloadable JSON file
         return dict(
-            content=json.dumps(config, indent=2),
+            content=orjson.dumps(config, option=orjson.OPT_INDENT_2).decode(),
             filename="dlc_filter_config.json",
             type="application/json"
         )
@@ -353,23 +410,29 @@ def register_filter_callbacks(app):
         Output("bodyparts-names-store", "data", allow_duplicate=True),
         [Input({"type": "bodypart-name", "index": ALL}, "value"),
          Input({"type": "bodypart-checkbox", "index": ALL}, "value")],
-        [State("bodyparts-names-store", "modified_timestamp")],
+        [
+            State("bodyparts-names-store", "modified_timestamp"),
+            State("bodyparts-names-store", "data")
+        ],
         prevent_initial_call=True  # Add this line
     )
-    def update_bodyparts_store(names, includes, timestamp):
+    def update_bodyparts_store(names, includes, timestamp, current_data):
         """Update the bodyparts store when inputs change."""
         ctx = callback_context
         
         # Skip this update if it was triggered by the callback above (using timestamp)
-        if timestamp and ctx.triggered and ctx.triggered[0]['prop_id'] == "bodyparts-names-store.modified_timestamp":
+        if timestamp and ctx.triggered_id == "bodyparts-names-store":
             raise dash.exceptions.PreventUpdate
         
         # Create data object
-        data = {}
-        for i, (name, include) in enumerate(zip(names, includes)):
-            data[str(i)] = {
-                "name": name or f"Bodypart {i}",
-                "include": include
-            }
+        data = {
+            str(i): {"name": name or f"Bodypart {i}", "include": include}
+            for i, (name, include) in enumerate(zip(names, includes))
+        }
+        
+        # Leave the store alone if nothing changed, so it does not re-trigger
+        # the callbacks that listen to it
+        if data == current_data:
+            return dash.no_update
         
         return data
\ No newline at end of file
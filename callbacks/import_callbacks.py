@@ -1,8 +1,12 @@
 from dash.dependencies import Input, Output, State
 from dash import html
+import orjson
 
 from utils.data_processing import parse_uploaded_json, get_data_summary
 
+# Longest JSON preview shown, the box only shows the start of it anyway
+_PREVIEW_MAX_BYTES = 4096
+
 def register_import_callbacks(app):
     """Register callbacks for the data import step."""
     
@@ -14,7 +18,8 @@ def register_import_callbacks(app):
             Output("proceed-to-discontinuity-btn", "disabled")
         ],
         [Input("upload-data", "contents")],
-        [State("upload-data", "filename")]
+        [State("upload-data", "filename")],
+        prevent_initial_call=True
     )
     def update_import_output(contents, filename):
         """Update the output based on the uploaded file."""
@@ -50,9 +55,13 @@ def register_import_callbacks(app):
             html.P(f"Body Parts: {len(summary.get('bodyparts', []))}", className="mb-1"),
         ])
         
-        # Create JSON preview
+        # Create JSON preview, serializing with orjson and truncating the text
+        # instead of building str() of a possibly huge frame
+        preview_text = orjson.dumps(data[0] if data else {})
+        if len(preview_text) > _PREVIEW_MAX_BYTES:
+            preview_text = preview_text[:_PREVIEW_MAX_BYTES] + b" ..."
         preview = html.Pre(
-            str(data[0] if data else {}),
+            preview_text.decode("utf-8", errors="ignore"),
             style={
                 "maxHeight": "200px", 
                 "overflow": "auto",
@@ -66,11 +75,12 @@ def register_import_callbacks(app):
     @app.callback(
         Output("workflow-tabs", "active_tab"),
         [Input("proceed-to-discontinuity-btn", "n_clicks")],
-        [State("stored-raw-data", "data")]
+        [State("proceed-to-discontinuity-btn", "disabled")]
     )
-    def proceed_to_discontinuity(n_clicks, data):
+    def proceed_to_discontinuity(n_clicks, disabled):
         """Proceed to the fix discontinuity tab when the button is clicked."""
-        if n_clicks is None or not data:
+        # The button is only enabled while imported data is stored
+        if n_clicks is None or disabled:
             return "tab-import"
         
         return "tab-discontinuity"
\ No newline at end of file
@@ -4,16 +4,152 @@ from dash.dependencies import Input, Output, State
 from dash import html
 import pandas as pd
 import json
+import functools
+import orjson
 import numpy as np
 import plotly.graph_objs as go
 
-from utils.data_processing import get_data_summary, extract_time_series
+from utils.data_processing import extract_time_series, get_soa
 from utils.plot_utils import create_time_series_plot, create_trajectory_plot, create_heatmap
 
+def _plot_x_position(df, name, fps):
+    """Plot the X position over time."""
+    return create_time_series_plot(df, "x", title=f"X Position: {name}", fps=fps)
+
+def _plot_y_position(df, name, fps):
+    """Plot the Y position over time."""
+    return create_time_series_plot(df, "y", title=f"Y Position: {name}", fps=fps)
+
+def _plot_trajectory(df, name, fps):
+    """Plot the trajectory (X vs Y)."""
+    return create_trajectory_plot(df, title=f"Trajectory: {name}", fps=fps)
+
+def _plot_heatmap(df, name, fps):
+    """Plot the occupancy heatmap of the valid positions."""
+    # Filter out NaN values with a mask on the columns (no DataFrame copy)
+    xs, ys = df['x'].to_numpy(), df['y'].to_numpy()
+    valid = ~(np.isnan(xs) | np.isnan(ys))
+    if not valid.any():
+        empty_fig = go.Figure()
+        empty_fig.update_layout(
+            title=f"Not enough valid data points for heatmap ({name})",
+            template="plotly_white"
+        )
+        return empty_fig
+        
+    return create_heatmap(
+        xs[valid],
+        ys[valid],
+        title=f"Occupancy Heatmap: {name}",
+        fps=fps
+    )
+
+# Plot builders by plot type dropdown value (and the older display-name
+# values); each takes the time series DataFrame, a title name and the FPS
+_PLOT_BUILDERS = {
+    "time_series_x": _plot_x_position,
+    "X Position Over Time": _plot_x_position,
+    "time_series_y": _plot_y_position,
+    "Y Position Over Time": _plot_y_position,
+    "trajectory": _plot_trajectory,
+    "Trajectory (X vs Y)": _plot_trajectory,
+    "heatmap": _plot_heatmap,
+    "Occupancy Heatmap": _plot_heatmap,
+}
+
+@functools.lru_cache(maxsize=4)
+def _parse_cached(payload):
+    """Parse a JSON string from a Store, reusing the result for repeated payloads."""
+    try:
+        return orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        # Non-strict JSON (e.g. NaN literals)
+        return json.loads(payload)
+
 def register_plot_callbacks(app):
     """Register callbacks for the visualization step."""
     
-    @app.callback(
+    # Update the dropdown options when entering the visualization tab. This
+    # runs in the browser, which already holds the filtered data, so tab
+    # switches do not upload the store to the server.
+    app.clientside_callback(
+        """
+        function(activeTab, filteredData) {
+            const empty = [[], null, [], null];
+            if (activeTab !== "tab-plot" || !filteredData) {
+                return empty;
+            }
+
+            // Handle the case when filteredData is a JSON string
+            if (typeof filteredData === "string") {
+                try {
+                    filteredData = JSON.parse(filteredData);
+                } catch (e) {
+                    return empty;
+                }
+            }
+
+            const hasMetadata = !Array.isArray(filteredData) && typeof filteredData === "object"
+                && "metadata" in filteredData;
+            const frames = (!Array.isArray(filteredData) && typeof filteredData === "object" && "data" in filteredData)
+                ? filteredData.data : filteredData;
+            if (!Array.isArray(frames) || frames.length === 0) {
+                return empty;
+            }
+
+            // Number of animals, as in get_data_summary
+            const first = frames[0];
+            let numAnimals = 0;
+            if ("bbox_scores" in first) {
+                numAnimals = first.bbox_scores.length;
+            } else if ("bodyparts" in first) {
+                numAnimals = first.bodyparts.length;
+            }
+            const animalOptions = [];
+            for (let i = 0; i < numAnimals; i++) {
+                animalOptions.push({label: "Animal " + (i + 1), value: i});
+            }
+
+            const bodypartOptions = [];
+            if (hasMetadata) {
+                // Add each bodypart that was included in the filter step
+                const bpNames = (filteredData.metadata || {}).bodypart_names || {};
+                for (const [idx, entry] of Object.entries(bpNames)) {
+                    if (entry && typeof entry === "object" && entry.include === true) {
+                        const name = "name" in entry ? entry.name : "Bodypart " + idx;
+                        bodypartOptions.push({label: name, value: parseInt(idx, 10)});
+                    }
+                }
+            } else if (numAnimals > 0 && first.bodyparts && first.bodyparts.length > 0) {
+                // Fallback - use the bodyparts of the first animal that have data in any frame
+                const numBodyparts = first.bodyparts[0].length;
+                const hasData = new Array(numBodyparts).fill(false);
+                for (const frame of frames) {
+                    const animal = frame.bodyparts && frame.bodyparts[0];
+                    if (!animal) {
+                        continue;
+                    }
+                    for (let bp = 0; bp < numBodyparts && bp < animal.length; bp++) {
+                        const point = animal[bp];
+                        if (point && typeof point[0] === "number" && typeof point[1] === "number"
+                                && !isNaN(point[0]) && !isNaN(point[1])) {
+                            hasData[bp] = true;
+                        }
+                    }
+                }
+                hasData.forEach((has, bp) => {
+                    if (has) {
+                        bodypartOptions.push({label: "Bodypart " + bp, value: bp});
+                    }
+                });
+            }
+
+            // Set default values if options exist
+            const defaultAnimal = animalOptions.length ? 0 : null;
+            const defaultBodypart = bodypartOptions.length ? bodypartOptions[0].value : null;
+            return [animalOptions, defaultAnimal, bodypartOptions, defaultBodypart];
+        }
+        """,
         [
             Output("animal-dropdown", "options"),
             Output("animal-dropdown", "value"),
@@ -21,80 +157,9 @@ def register_plot_callbacks(app):
             Output("bodypart-dropdown", "value")
         ],
         [Input("workflow-tabs", "active_tab")],
-        [State("stored-filtered-data", "data")]
+        [State("stored-filtered-data", "data")],
+        prevent_initial_call=True
     )
-    def update_plot_options(active_tab, filtered_data):
-        """Update the dropdown options when entering the visualization tab."""
-        print("Entering update_plot_options")
-        print("Filtered data type:", type(filtered_data))
-        if active_tab != "tab-plot" or not filtered_data:
-            return [], None, [], None
-        
-        # Handle the case when filtered_data is a JSON string (common when coming from dcc.Store)
-        if isinstance(filtered_data, str):
-            try:
-                filtered_data = json.loads(filtered_data)
-            except:
-                pass
-        
-        # Get summary info
-        summary = get_data_summary(filtered_data)
-        num_animals = summary.get("num_animals", 0)
-        
-        # Create animal options
-        animal_options = [
-            {"label": f"Animal {i+1}", "value": i}
-            for i in range(num_animals)
-        ]
-        
-        # Extract body part names from metadata
-        bodypart_options = []
-        
-        # Check if we have metadata
-        if isinstance(filtered_data, dict) and 'metadata' in filtered_data:
-            print("Metadata found:", filtered_data['metadata'])
-            bp_names = filtered_data['metadata'].get('bodypart_names', {})
-            print("Body part names:", bp_names)
-            # Count included body parts
-            included_count = 0
-            for idx, data in bp_names.items():
-                if isinstance(data, dict) and data.get('include') == True:
-                    included_count += 1
-            print(f"Found {included_count} included body parts")
-            
-            # Add each selected bodypart to options
-            for idx, data in bp_names.items():
-                # Only add bodypart if it was included
-                if isinstance(data, dict) and data.get('include') == True:
-                    name = data.get('name', f"Bodypart {idx}")
-                    bodypart_options.append({"label": name, "value": int(idx)})
-        else:
-            # Fallback - use the data to determine which bodyparts have data
-            actual_data = filtered_data.get('data', filtered_data)
-            if actual_data and len(actual_data) > 0 and 'bodyparts' in actual_data[0] and len(actual_data[0]['bodyparts']) > 0:
-                # For each possible bodypart index
-                for bp_idx in range(len(actual_data[0]['bodyparts'][0])):
-                    # Check if any frame has non-NaN data for this bodypart
-                    has_data = False
-                    for frame in actual_data:
-                        if len(frame['bodyparts'][0]) > bp_idx:
-                            x, y, _ = frame['bodyparts'][0][bp_idx]
-                            if not (np.isnan(x) or np.isnan(y)):
-                                has_data = True
-                                break
-                    
-                    # Only add bodyparts that have actual data
-                    if has_data:
-                        bodypart_options.append({"label": f"Bodypart {bp_idx}", "value": bp_idx})
-        
-        # Print debug info
-        print(f"Found {len(bodypart_options)} bodypart options")
-        
-        # Set default values if options exist
-        default_animal = 0 if animal_options else None
-        default_bodypart = bodypart_options[0]["value"] if bodypart_options else None
-        
-        return animal_options, default_animal, bodypart_options, default_bodypart
     
     # Your existing generate_plot callback
     @app.callback(
@@ -104,10 +169,11 @@ def register_plot_callbacks(app):
             State("plot-type-dropdown", "value"),
             State("animal-dropdown", "value"), 
             State("bodypart-dropdown", "value"),
-            State("stored-filtered-data", "data")
+            State("stored-filtered-data", "data"),
+            State("stored-filtered-data", "modified_timestamp")
         ]
     )
-    def generate_plot(n_clicks, plot_type, animal_idx, bodypart_idx, filtered_data):
+    def generate_plot(n_clicks, plot_type, animal_idx, bodypart_idx, filtered_data, filtered_timestamp):
         """Generate the plot based on selections."""
         if n_clicks is None or animal_idx is None or bodypart_idx is None:
             return {}
@@ -115,10 +181,13 @@ def register_plot_callbacks(app):
         # Handle the case when filtered_data is a JSON string
         if isinstance(filtered_data, str):
             try:
-                filtered_data = json.loads(filtered_data)
+                filtered_data = _parse_cached(filtered_data)
             except:
                 pass
         
+        # Convert once per filtered data version; repeated plots reuse the arrays
+        get_soa(filtered_data, cache_key=("stored-filtered-data", filtered_timestamp))
+        
         # Get bodypart name for title
         bodypart_name = f"Bodypart {bodypart_idx}"
         
@@ -135,40 +204,7 @@ def register_plot_callbacks(app):
         df, fps = extract_time_series(filtered_data, animal_idx, bodypart_idx)
         
         # Generate the appropriate plot
-        if plot_type == "time_series_x" or plot_type == "X Position Over Time":
-            return create_time_series_plot(
-                df, "x", 
-                title=f"X Position: Animal {animal_idx+1}, {bodypart_name}",
-                fps=fps
-            )
-        elif plot_type == "time_series_y" or plot_type == "Y Position Over Time":
-            return create_time_series_plot(
-                df, "y", 
-                title=f"Y Position: Animal {animal_idx+1}, {bodypart_name}",
-                fps=fps  # Add fps parameter here
-            )
-        elif plot_type == "trajectory" or plot_type == "Trajectory (X vs Y)":
-            return create_trajectory_plot(
-                df,
-                title=f"Trajectory: Animal {animal_idx+1}, {bodypart_name}",
-                fps=fps  # Add fps parameter here
-            )
-        elif plot_type == "heatmap" or plot_type == "Occupancy Heatmap":
-            # Filter out NaN values
-            valid_df = df.dropna(subset=['x', 'y'])
-            if valid_df.empty:
-                empty_fig = go.Figure()
-                empty_fig.update_layout(
-                    title=f"Not enough valid data points for heatmap (Animal {animal_idx+1}, {bodypart_name})",
-                    template="plotly_white"
-                )
-                return empty_fig
-                
-            return create_heatmap(
-                valid_df['x'].values,
-                valid_df['y'].values,
-                title=f"Occupancy Heatmap: Animal {animal_idx+1}, {bodypart_name}",
-                fps=fps  # Add fps parameter here
-            )
-        
-        return {}
\ No newline at end of file
+        builder = _PLOT_BUILDERS.get(plot_type)
+        if builder is None:
+            return {}
+        return builder(df, f"Animal {animal_idx+1}, {bodypart_name}", fps)
\ No newline at end of file
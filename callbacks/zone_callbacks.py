@@ -1,14 +1,21 @@
 # Author: Aman Rathore
 
 import dash
+import functools
 import traceback
 from dash import Input, Output, State, callback, no_update
+import numpy as np
 import plotly.graph_objects as go
 from utils.zones_handling import ZonesHandler
 import base64
 from PIL import Image
 import io
 
+@functools.lru_cache(maxsize=16)
+def _build_zones_handler(zone_code, circle_resolution=128):
+    """Parse zone code, reusing the ZonesHandler when the code is unchanged."""
+    return ZonesHandler(zone_code, circle_resolution=circle_resolution)
+
 def register_zone_callbacks(app):
     @app.callback(
         Output("zones-plot", "figure"),
@@ -27,8 +34,9 @@ def register_zone_callbacks(app):
             return {}, "", False, None
         
         try:
-            # Create a ZonesHandler object from the code
-            zh = ZonesHandler(zone_code, circle_resolution=128)
+            # Create a ZonesHandler object from the code (cached, so changing
+            # only the image or opacity does not parse the zones again)
+            zh = _build_zones_handler(zone_code)
             zones = zh.get_zones()
             
             if not zones:
@@ -38,9 +46,9 @@ def register_zone_callbacks(app):
             fig = go.Figure()
             
             # Calculate bounds for all zones
-            bounds = [zh.get_bounds(z) for z in zones]
-            xmin, ymin = min(b[0] for b in bounds), min(b[1] for b in bounds)
-            xmax, ymax = max(b[2] for b in bounds), max(b[3] for b in bounds)
+            bounds = np.array([zh.get_bounds(z) for z in zones], dtype=float)
+            xmin, ymin = bounds[:, :2].min(axis=0)
+            xmax, ymax = bounds[:, 2:].max(axis=0)
             
             # Add some padding to the bounds
             padding = max(xmax - xmin, ymax - ymin) * 0.05
@@ -95,14 +103,14 @@ def register_zone_callbacks(app):
                     font=dict(size=12)
                 )
             
+            # Visibility mask of every zone, one row per zone
+            vis_matrix = np.zeros((len(zones), len(fig.data)), dtype=bool)
+            for i, name in enumerate(zones):
+                vis_matrix[i, traces_per_zone[name]] = True
+            
             # Create dropdown buttons for zone selection
             buttons = []
-            for name in zones:
-                # Create visibility mask
-                vis = [False] * len(fig.data)
-                for tidx in traces_per_zone[name]:
-                    vis[tidx] = True
-                
+            for name, vis in zip(zones, vis_matrix.tolist()):
                 buttons.append(dict(
                     label=name,
                     method="update",
@@ -172,12 +180,13 @@ def register_zone_callbacks(app):
     @app.callback(
         Output("workflow-tabs", "active_tab", allow_duplicate=True),
         [Input("proceed-to-filter-btn-zones", "n_clicks")],
-        [State("stored-processed-data", "data")],
+        [State("has-processed-data", "data")],
         prevent_initial_call=True
     )
-    def proceed_to_filtering(n_clicks, processed_data):
+    def proceed_to_filtering(n_clicks, has_processed_data):
         """Proceed to the filter tab when the button is clicked."""
-        if n_clicks is None or not processed_data:
+        # The flag avoids sending the processed data itself
+        if n_clicks is None or not has_processed_data:
             raise dash.exceptions.PreventUpdate
         return "tab-filter"
 
@@ -186,13 +195,16 @@ def register_zone_callbacks(app):
 def add_zone_traces(fig, geom, visible=False, name=None):
     """Helper to add all traces for a given zone geometry."""
     parts = getattr(geom, "geoms", [geom])
+    # Collect the traces and add them in one call, which validates the
+    # figure once instead of once per ring
+    traces = []
     for part in parts:
         if part.geom_type != "Polygon":
             continue
-        # exterior ring
-        x_ext, y_ext = part.exterior.xy
-        fig.add_trace(go.Scatter(
-            x=list(x_ext), y=list(y_ext),
+        # exterior ring, passed to Plotly as arrays without building lists
+        ext = np.asarray(part.exterior.coords)
+        traces.append(go.Scatter(
+            x=ext[:, 0], y=ext[:, 1],
             fill="toself",
             name=name,
             visible=visible,
@@ -202,9 +214,9 @@ def add_zone_traces(fig, geom, visible=False, name=None):
         ))
         # interior rings (holes)
         for interior in part.interiors:
-            xi, yi = interior.xy
-            fig.add_trace(go.Scatter(
-                x=list(xi), y=list(yi),
+            hole = np.asarray(interior.coords)
+            traces.append(go.Scatter(
+                x=hole[:, 0], y=hole[:, 1],
                 fill="toself",
                 fillcolor="rgba(255, 255, 255, 0.1)",  # zone opacity
                 line=dict(width=0),
@@ -212,11 +224,22 @@ def add_zone_traces(fig, geom, visible=False, name=None):
                 showlegend=False,
                 visible=visible
             ))
+    if traces:
+        fig.add_traces(traces)
+
 
+# Base64 characters decoded to read the image header (a multiple of 4)
+_IMAGE_HEADER_CHARS = 64 * 1024
 
 def get_image_size_from_base64(base64_str):
     """Extract width and height from a base64 image string."""
-    header, encoded = base64_str.split(',', 1)
-    img_bytes = base64.b64decode(encoded)
-    img = Image.open(io.BytesIO(img_bytes))
+    # Slice after the data URL header instead of splitting, which would copy
+    # the whole (possibly multi-megabyte) string
+    start = base64_str.index(',') + 1
+    # Image.open only parses the header, so decoding the start of the image is
+    # usually enough. Fall back to the whole image if the header is longer.
+    try:
+        img = Image.open(io.BytesIO(base64.b64decode(base64_str[start:start + _IMAGE_HEADER_CHARS])))
+    except (OSError, ValueError):
+        img = Image.open(io.BytesIO(base64.b64decode(base64_str[start:])))
     return img.width, img.height
\ No newline at end of file
@@ -124,6 +124,9 @@ def create_filter_panel():
                     # Store for bodypart names and selection states
                     dcc.Store(id="bodyparts-names-store"),
                     
+                    # Data version and settings of the last applied filter
+                    dcc.Store(id="applied-filter-key"),
+                    
                     # Filter button
                     dbc.Button(
                         "Apply Filters", 
@@ -169,112 +172,4 @@ def create_filter_panel():
             });
             ''')
         ])
-    ])
-
-
-def register_filter_callbacks(app):
-    """Register callbacks for the data filtering step."""
-    
-    @app.callback(
-        [
-            Output("data-summary", "children"),
-            Output("body-parts-dropdown", "options")
-        ],
-        [Input("workflow-tabs", "active_tab")],
-        [State("stored-raw-data", "data")]
-    )
-    def update_filter_panel(active_tab, raw_data):
-        """Update the filter panel with data from the imported JSON."""
-        if active_tab != "tab-filter" or not raw_data:
-            return "Import data first", []
-        
-        # Get data summary
-        summary = get_data_summary(raw_data)
-        
-        # Create data summary display
-        summary_html = html.Div([
-            html.P(f"Total Frames: {summary.get('num_frames', 'Unknown')}", className="mb-1"),
-            html.P(f"Animals Detected: {summary.get('num_animals', 'Unknown')}", className="mb-1"),
-            html.P(f"Body Parts Available: {len(summary.get('bodyparts', []))}", className="mb-1"),
-        ])
-        
-        # Create body parts options
-        bp_options = [
-            {"label": f"Bodypart {bp_idx}", "value": bp_idx}
-            for bp_idx in range(len(summary.get('bodyparts', [])))
-        ]
-        
-        return summary_html, bp_options
-    
-    @app.callback(
-        [
-            Output("filter-preview", "children"),
-            Output("filter-preview-plot", "figure"),
-            Output("stored-filtered-data", "data"),
-            Output("proceed-to-viz-btn", "disabled")
-        ],
-        [Input("apply-filters-btn", "n_clicks")],
-        [
-            State("stored-raw-data", "data"),
-            State("num-animals-slider", "value"),
-            State("confidence-threshold-slider", "value"),
-            State("body-parts-dropdown", "value"),
-            State("workflow-tabs", "active_tab")
-        ]
-    )
-    def apply_data_filters(n_clicks, raw_data, num_animals, conf_threshold, selected_bodyparts, active_tab):
-        """Apply filters to the raw data and show preview."""
-        if n_clicks is None or not raw_data or active_tab != "tab-filter":
-            return "Apply filters to see preview", {}, None, True
-        
-        # Apply filters
-        filtered_data = filter_data(
-            raw_data, 
-            num_animals=num_animals, 
-            confidence_threshold=conf_threshold,
-            selected_bodyparts=selected_bodyparts
-        )
-        
-        # Create preview info
-        original_summary = get_data_summary(raw_data)
-        filtered_summary = get_data_summary(filtered_data)
-        
-        preview_html = html.Div([
-            html.P("Filtering Results:", className="mb-1"),
-            html.P(f"Frames: {filtered_summary.get('num_frames')} (was {original_summary.get('num_frames')})", className="mb-1"),
-            html.P(f"Animals: {filtered_summary.get('num_animals')} (limited from {original_summary.get('num_animals')})", className="mb-1"),
-            html.P(f"Confidence Threshold: {conf_threshold}", className="mb-1"),
-            html.P(f"Selected Body Parts: {len(selected_bodyparts) if selected_bodyparts else 'All'}", className="mb-1")
-        ])
-        
-        # Create preview plot
-        figure = {}
-        if filtered_data and filtered_summary.get('num_animals', 0) > 0:
-            # Pick the first animal and body part for preview
-            animal_idx = 0
-            bodypart_idx = selected_bodyparts[0] if selected_bodyparts else 0
-            
-            # Extract time series
-            df = extract_time_series(filtered_data, animal_idx, bodypart_idx)
-            
-            # Create plot
-            figure = create_time_series_plot(
-                df, 
-                "x", 
-                title=f"Preview: Animal {animal_idx+1}, Bodypart {bodypart_idx+1} X Position"
-            )
-        
-        return preview_html, figure, filtered_data, False
-    
-    @app.callback(
-        Output("workflow-tabs", "active_tab", allow_duplicate=True),
-        [Input("proceed-to-viz-btn", "n_clicks")],
-        [State("stored-filtered-data", "data")],
-        prevent_initial_call=True
-    )
-    def proceed_to_visualization(n_clicks, filtered_data):
-        """Proceed to the visualization tab when the button is clicked."""
-        if n_clicks is None or not filtered_data:
-            return "tab-filter"
-        
-        return "tab-plot"
\ No newline at end of file
+    ])
\ No newline at end of file
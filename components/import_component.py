@@ -31,7 +31,7 @@ def create_import_panel():
             ),
             
             # File info display
-            html.Div(id="file-info"),
+            html.Div(html.P("No file selected"), id="file-info"),
             
             # JSON preview
             html.Div([
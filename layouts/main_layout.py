@@ -24,6 +24,7 @@ def create_layout():
         dcc.Store(id="stored-raw-data"),
         dcc.Store(id="stored-filtered-data"),
         dcc.Store(id="stored-processed-data"),
+        dcc.Store(id="has-processed-data", data=False),  # Whether processed data is stored
         dcc.Store(id="current-tab", data="tab-import"),  # Track active tab
         
         # Tabs for the workflow
@@ -2,21 +2,201 @@
 
 import json
 import base64
+import binascii
+import hashlib
+import threading
+import orjson
 import pandas as pd
 import numpy as np
 from io import StringIO
+from collections import OrderedDict
+
+# Recent to_soa() conversions, see get_soa(). Callbacks can run in several
+# threads, so the cache is only used under its lock.
+_SOA_CACHE = OrderedDict()
+_SOA_CACHE_SIZE = 8
+_SOA_CACHE_LOCK = threading.Lock()
+
+# Base64 characters decoded at a time by _decode_data_url() (a multiple of 4)
+_B64_CHUNK_CHARS = 4 * 1024 * 1024
+
+def _decode_data_url(contents):
+    """
+    Decode the base64 payload of a data URL.
+
+    The payload is decoded in chunks straight from the URL string, so no
+    full-size copy of the (possibly very large) base64 text is made.
+    """
+    start = contents.index(',') + 1
+    decoded = bytearray()
+    try:
+        for pos in range(start, len(contents), _B64_CHUNK_CHARS):
+            decoded += base64.b64decode(contents[pos:pos + _B64_CHUNK_CHARS], validate=True)
+    except binascii.Error:
+        # Payloads with line breaks or other extra characters do not split
+        # on 4-character boundaries, decode them in one go
+        decoded = bytearray(base64.b64decode(contents[start:]))
+    return decoded
 
 def parse_uploaded_json(contents):
     """Parse uploaded JSON file contents and return the data."""
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string).decode('utf-8')
+    decoded = _decode_data_url(contents)
     
     try:
-        data = json.loads(decoded)
+        try:
+            data = orjson.loads(decoded)
+        except orjson.JSONDecodeError:
+            # Files written by Python's json module may contain NaN literals,
+            # which orjson rejects
+            data = json.loads(decoded.decode('utf-8'))
         return data, None
     except Exception as e:
         return None, str(e)
 
+def to_soa(data):
+    """
+    Convert tracking frames into three (frames, animals, bodyparts) arrays X, Y, C.
+
+    The arrays are views into one contiguous buffer. Missing values (NaN or
+    null) become NaN; frames with fewer animals or bodyparts than the widest
+    frame are padded with NaN.
+    """
+    # Handle different data structures
+    if isinstance(data, dict) and 'data' in data:
+        frames = data['data']
+    else:
+        frames = data
+
+    if not frames or not isinstance(frames, list):
+        return tuple(np.empty((3, 0, 0, 0)))
+
+    try:
+        arr = np.array([frame['bodyparts'] for frame in frames], dtype=float)
+    except (KeyError, TypeError, ValueError):
+        arr = None
+
+    if arr is None or arr.ndim != 4 or arr.shape[3] != 3:
+        # Ragged or partially missing frames - pad to the widest frame
+        num_animals = max(len(frame.get('bodyparts', [])) for frame in frames)
+        num_bodyparts = max(
+            (len(animal) for frame in frames for animal in frame.get('bodyparts', [])),
+            default=0
+        )
+        arr = np.full((len(frames), num_animals, num_bodyparts, 3), np.nan)
+        for frame_idx, frame in enumerate(frames):
+            for animal_idx, animal_data in enumerate(frame.get('bodyparts', [])):
+                if len(animal_data) > 0:
+                    arr[frame_idx, animal_idx, :len(animal_data)] = np.array(animal_data, dtype=float)
+
+    # Move the x/y/conf axis to the front so each component is contiguous
+    X, Y, C = np.ascontiguousarray(np.moveaxis(arr, -1, 0))
+    return X, Y, C
+
+def from_soa(frames, X, Y, C):
+    """
+    Rebuild tracking frames with the bodyparts taken from X, Y, C arrays.
+    Other frame fields are kept.
+
+    Each frame's bodyparts is a read-only (animals, bodyparts, 3) view into
+    one buffer, which Dash and orjson serialize like the nested lists, so no
+    Python lists are built. The new frames are added to the get_soa() cache,
+    so converting them back to arrays is free.
+    """
+    values = np.stack([X, Y, C], axis=-1)
+    values.flags.writeable = False
+    new_frames = [dict(frame, bodyparts=bp) for frame, bp in zip(frames, values)]
+
+    _cache_soa(('id', id(new_frames)), tuple(np.moveaxis(values, -1, 0)), len(new_frames), new_frames)
+    return new_frames
+
+def _cache_soa(key, arrays, num_frames, frames=None):
+    """Add a conversion to the get_soa() cache, evicting the oldest entries."""
+    for arr in arrays:
+        arr.flags.writeable = False
+    with _SOA_CACHE_LOCK:
+        _SOA_CACHE[key] = (frames, num_frames, arrays)
+        _SOA_CACHE.move_to_end(key)
+        while len(_SOA_CACHE) > _SOA_CACHE_SIZE:
+            _SOA_CACHE.popitem(last=False)
+
+def _cached_soa(key):
+    """Return the get_soa() cache entry for key (marking it recently used), or None."""
+    with _SOA_CACHE_LOCK:
+        entry = _SOA_CACHE.get(key)
+        if entry is not None:
+            _SOA_CACHE.move_to_end(key)
+        return entry
+
+def data_fingerprint(data):
+    """
+    Return a short string identifying tracking data, for cache keys.
+
+    Made from the number of frames and a hash of the first, middle and last
+    frames, so it is cheap for any size of data. This is only a best-effort
+    check: data differing in other frames gets the same fingerprint. Cache
+    keys built from a store's modified_timestamp include it to catch the
+    common cases where two sessions (or a replayed request) send the same
+    client-side timestamp with different data.
+    """
+    # Handle different data structures
+    if isinstance(data, dict) and 'data' in data:
+        frames = data['data']
+    else:
+        frames = data
+
+    if not frames or not isinstance(frames, list):
+        return "0:"
+
+    digest = hashlib.blake2b(digest_size=8)
+    for frame in (frames[0], frames[len(frames) // 2], frames[-1]):
+        try:
+            digest.update(orjson.dumps(frame, option=orjson.OPT_SERIALIZE_NUMPY))
+        except TypeError:
+            digest.update(repr(frame).encode())
+    return f"{len(frames)}:{digest.hexdigest()}"
+
+def get_soa(data, cache_key=None):
+    """
+    Return to_soa(data), reusing an earlier conversion of the same data.
+
+    Conversions are found by object identity, so helpers called on the same
+    data within a callback only convert it once. Passing a cache_key (e.g. the
+    store id and its modified_timestamp) also reuses the conversion across
+    callbacks, which receive freshly deserialized data each time; the key is
+    combined with data_fingerprint(), so only matching data is reused.
+    The returned arrays are shared and read-only.
+    """
+    # Handle different data structures
+    if isinstance(data, dict) and 'data' in data:
+        frames = data['data']
+    else:
+        frames = data
+
+    if not frames or not isinstance(frames, list):
+        return to_soa(frames)
+
+    id_key = ('id', id(frames))
+    entry = _cached_soa(id_key)
+    if entry is not None and entry[0] is frames:
+        return entry[2]
+
+    arrays = None
+    if cache_key is not None:
+        key = ('key', cache_key, data_fingerprint(frames))
+        entry = _cached_soa(key)
+        if entry is not None:
+            arrays = entry[2]
+
+    if arrays is None:
+        arrays = to_soa(frames)
+        if cache_key is not None:
+            _cache_soa(key, arrays, len(frames))
+
+    # Keep a reference to frames so its id cannot be reused while cached
+    _cache_soa(id_key, arrays, len(frames), frames)
+
+    return arrays
+
 def get_data_summary(data):
     """Get summary information about the tracking data."""
     summary = {}
@@ -60,34 +240,41 @@ def get_data_summary(data):
 
 def filter_data(raw_data, num_animals=2, confidence_threshold=0.5, selected_bodyparts=None):
     """Filter the tracking data based on user parameters."""
-    filtered_data = []
+    # Handle different data structures
+    if isinstance(raw_data, dict) and 'data' in raw_data:
+        frames = raw_data['data']
+    else:
+        frames = raw_data
     
-    # Filter frames and apply thresholds
-    for frame in raw_data:
-        frame_copy = frame.copy()
+    filtered_frames = []
+    if frames:
+        # Views of the kept animals; the cached arrays are read-only
+        X, Y, C = (arr[:, :num_animals] for arr in get_soa(raw_data))
         
-        # Limit number of animals
-        if 'bboxes' in frame_copy:
-            frame_copy['bboxes'] = frame_copy['bboxes'][:num_animals]
-        if 'bbox_scores' in frame_copy:
-            frame_copy['bbox_scores'] = frame_copy['bbox_scores'][:num_animals]
-        if 'bodyparts' in frame_copy:
-            frame_copy['bodyparts'] = frame_copy['bodyparts'][:num_animals]
-            
-            # Apply confidence threshold
-            for animal_idx, animal_data in enumerate(frame_copy['bodyparts']):
-                for bp_idx, (x, y, conf) in enumerate(animal_data):
-                    # If confidence below threshold or not in selected bodyparts, set to NaN
-                    if (conf < confidence_threshold) or (
-                        selected_bodyparts and bp_idx not in selected_bodyparts
-                    ):
-                        frame_copy['bodyparts'][animal_idx][bp_idx] = [np.nan, np.nan, np.nan]
+        # If confidence below threshold or not in selected bodyparts, set to NaN
+        with np.errstate(invalid='ignore'):
+            remove = C < confidence_threshold
+        if selected_bodyparts:
+            remove |= ~np.isin(np.arange(C.shape[2]), selected_bodyparts)
+        # Clean data needs no copies, from_soa() reads the views directly
+        if remove.any():
+            X, Y, C = X.copy(), Y.copy(), C.copy()
+            X[remove] = Y[remove] = C[remove] = np.nan
+        
+        # from_soa() copies each frame, so the new frames can be trimmed in
+        # place without touching the input
+        filtered_frames = from_soa(frames, X, Y, C)
         
-        filtered_data.append(frame_copy)
+        # Limit number of animals
+        for frame in filtered_frames:
+            if 'bboxes' in frame:
+                frame['bboxes'] = frame['bboxes'][:num_animals]
+            if 'bbox_scores' in frame:
+                frame['bbox_scores'] = frame['bbox_scores'][:num_animals]
     
     # Return data with metadata structure
     return {
-        'data': filtered_data,
+        'data': filtered_frames,
         'metadata': {}  # Will be filled by callback
     }
 
@@ -95,59 +282,49 @@ def extract_time_series(filtered_data, animal_idx, bodypart_idx):
     """Extract time series data for a specific animal and body part."""
     # Handle different data storage formats
     if isinstance(filtered_data, dict) and 'data' in filtered_data:
-        data = filtered_data['data']
         metadata = filtered_data.get('metadata', {})
     else:
-        data = filtered_data
         metadata = {}
     
     # Get FPS value from metadata or use default
     fps = metadata.get('fps', 30)  # Default to 30 fps if not specified
     
-    frames = []
-    x_values = []
-    y_values = []
-    
-    for frame_idx, frame in enumerate(data):
-        if 'bodyparts' in frame and len(frame['bodyparts']) > animal_idx:
-            animal_data = frame['bodyparts'][animal_idx]
-            if len(animal_data) > bodypart_idx:
-                x, y, conf = animal_data[bodypart_idx]
-                frames.append(frame_idx)
-                x_values.append(x)
-                y_values.append(y)
+    X, Y, C = get_soa(filtered_data)
+    num_frames, num_animals, num_bodyparts = C.shape
+    if animal_idx < num_animals and bodypart_idx < num_bodyparts:
+        frames = np.arange(num_frames)
+        x_values = X[:, animal_idx, bodypart_idx]
+        y_values = Y[:, animal_idx, bodypart_idx]
+    else:
+        frames = x_values = y_values = np.array([])
     
-    # Create a DataFrame
+    # Create the DataFrame with its time columns (based on FPS) in one go
+    seconds = frames / fps
     df = pd.DataFrame({
         'frame': frames,
         'x': x_values,
-        'y': y_values
+        'y': y_values,
+        'seconds': seconds,
+        'minutes': seconds / 60
     })
     
-    # Add time columns based on FPS
-    df['seconds'] = df['frame'] / fps
-    df['minutes'] = df['seconds'] / 60
-    
     return df, fps
 
 def create_occupancy_data(data, animal_idx, bodypart_idx, grid_size=100):
     """Create occupancy heatmap data for a specific animal and bodypart."""
-    xs, ys = [], []
-    
-    for frame in data:
-        if 'bodyparts' in frame and len(frame['bodyparts']) > animal_idx:
-            bodyparts = frame['bodyparts'][animal_idx]
-            if len(bodyparts) > bodypart_idx:
-                x, y, conf = bodyparts[bodypart_idx]
-                if not np.isnan(x) and not np.isnan(y):
-                    xs.append(x)
-                    ys.append(y)
+    X, Y, _ = get_soa(data)
+    if animal_idx >= X.shape[1] or bodypart_idx >= X.shape[2]:
+        return np.array([]), np.array([])
     
-    return np.array(xs), np.array(ys)
+    # Frames that lack the animal or bodypart are NaN-padded and dropped here
+    xs = X[:, animal_idx, bodypart_idx]
+    ys = Y[:, animal_idx, bodypart_idx]
+    valid = ~(np.isnan(xs) | np.isnan(ys))
+    return xs[valid], ys[valid]
 
 def data_to_csv(data, animal_idx, bodypart_idx):
     """Convert tracking data to CSV for export."""
-    df = extract_time_series(data, animal_idx, bodypart_idx)
+    df, _ = extract_time_series(data, animal_idx, bodypart_idx)
     return df.to_csv(index=False)
 
 def add_metadata_to_list(data_list):
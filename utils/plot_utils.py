@@ -3,6 +3,7 @@
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+from scipy.signal import fftconvolve
 from scipy.stats import gaussian_kde
 
 def create_time_series_plot(df, columns, title="", plot_type=None, fps=30):
@@ -35,6 +36,35 @@ def create_time_series_plot(df, columns, title="", plot_type=None, fps=30):
     
     return fig
 
+def downsample_indices(values, max_points=2000):
+    """
+    Return sorted indices of a subset of values that keeps the shape of a line plot.
+
+    The series is split into max_points // 2 equal buckets and the minimum and
+    maximum of each bucket are kept, so spikes survive. Buckets with missing
+    values also keep one NaN position so gaps still show, and the last point
+    is always kept. Short series are returned whole.
+    """
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    
+    num_buckets = max(max_points // 2, 1)
+    size = -(-n // num_buckets)
+    padded = np.full(num_buckets * size, np.nan)
+    padded[:n] = values
+    buckets = padded.reshape(num_buckets, size)
+    missing = np.isnan(buckets)
+    
+    offsets = np.arange(num_buckets) * size
+    lows = np.where(missing, np.inf, buckets).argmin(axis=1) + offsets
+    highs = np.where(missing, -np.inf, buckets).argmax(axis=1) + offsets
+    has_gap = missing.any(axis=1)
+    gaps = missing.argmax(axis=1)[has_gap] + offsets[has_gap]
+    
+    indices = np.unique(np.concatenate([lows, highs, gaps, [n - 1]]))
+    return indices[indices < n]
+
 def create_heatmap(xs, ys, grid_size=100, title=None, fps=30):
     """Create an occupancy heatmap using Gaussian KDE with support for time information."""
     # Drop any NaNs
@@ -68,9 +98,7 @@ def create_heatmap(xs, ys, grid_size=100, title=None, fps=30):
     
     xi = np.linspace(x_min, x_max, grid_size)
     yi = np.linspace(y_min, y_max, grid_size)
-    xx, yy = np.meshgrid(xi, yi)
-    grid_coords = np.vstack([xx.ravel(), yy.ravel()])
-    zi = kde(grid_coords).reshape(xx.shape)
+    zi = _binned_kde(xs_clean, ys_clean, xi, yi, kde.covariance)
     
     # Create the heatmap
     fig = go.Figure(go.Heatmap(
@@ -100,6 +128,64 @@ def create_heatmap(xs, ys, grid_size=100, title=None, fps=30):
     
     return fig
 
+def _binned_kde(xs, ys, xi, yi, covariance):
+    """
+    Evaluate a Gaussian KDE on the grid xi, yi from points binned onto the grid.
+
+    Each point is split linearly between its four neighbouring grid nodes and
+    the counts are convolved with the kernel, which costs O(N + G^2 log G)
+    instead of evaluating every point at every grid node.
+    """
+    nx, ny = len(xi), len(yi)
+    dx, dy = xi[1] - xi[0], yi[1] - yi[0]
+    
+    # Linear binning: grid cell of each point and its offset within the cell
+    fx = (xs - xi[0]) / dx
+    fy = (ys - yi[0]) / dy
+    ix = np.clip(np.floor(fx).astype(int), 0, nx - 2)
+    iy = np.clip(np.floor(fy).astype(int), 0, ny - 2)
+    wx = fx - ix
+    wy = fy - iy
+    
+    counts = np.zeros(ny * nx)
+    for off_y, off_x, weight in (
+        (0, 0, (1 - wy) * (1 - wx)),
+        (0, 1, (1 - wy) * wx),
+        (1, 0, wy * (1 - wx)),
+        (1, 1, wy * wx),
+    ):
+        counts += np.bincount((iy + off_y) * nx + ix + off_x, weights=weight, minlength=ny * nx)
+    counts = counts.reshape(ny, nx)
+    
+    # Kernel sampled at every grid offset, so the convolution covers the grid.
+    # Rows are y offsets and columns x offsets, broadcast without a meshgrid.
+    ox = np.arange(-(nx - 1), nx)[None, :] * dx
+    oy = np.arange(-(ny - 1), ny)[:, None] * dy
+    inv_cov = np.linalg.inv(covariance)
+    exponent = (inv_cov[0, 0] * ox**2 + 2 * inv_cov[0, 1] * ox * oy + inv_cov[1, 1] * oy**2) / 2
+    kernel = np.exp(-exponent) / (2 * np.pi * np.sqrt(np.linalg.det(covariance)))
+    
+    density = fftconvolve(counts, kernel, mode="same") / len(xs)
+    # FFT round-off can leave tiny negative values
+    return np.clip(density, 0, None)
+
+def _binned_kde_1d(values, grid, variance):
+    """Evaluate a 1-D Gaussian KDE on an even grid from linearly binned values, like _binned_kde."""
+    n = len(grid)
+    step = grid[1] - grid[0]
+    
+    pos = (values - grid[0]) / step
+    idx = np.clip(np.floor(pos).astype(int), 0, n - 2)
+    weight = pos - idx
+    counts = (np.bincount(idx, weights=1 - weight, minlength=n)
+              + np.bincount(idx + 1, weights=weight, minlength=n))
+    
+    offsets = np.arange(-(n - 1), n) * step
+    kernel = np.exp(-offsets**2 / (2 * variance)) / np.sqrt(2 * np.pi * variance)
+    
+    density = fftconvolve(counts, kernel, mode="same") / len(values)
+    return np.clip(density, 0, None)
+
 def create_trajectory_plot(df, title=None, fps=30):
     """Create a trajectory plot using the x and y position data with time information."""
     if df.empty or df["x"].isna().all() or df["y"].isna().all():
@@ -131,8 +217,10 @@ def create_trajectory_plot(df, title=None, fps=30):
                      title=title or "Movement Trajectory",
                      labels={time_col: time_label})
     
-    # Add lines connecting the points
-    fig.add_trace(go.Scatter(
+    # Add lines connecting the points, with WebGL like Plotly Express uses for
+    # the points trace once there are more than 1000 of them
+    scatter = go.Scattergl if len(df) > 1000 else go.Scatter
+    fig.add_trace(scatter(
         x=df["x"], 
         y=df["y"],
         mode="lines",
@@ -163,8 +251,9 @@ def create_distribution_plot(df, column, title=None):
     if len(df) > 5 and not df[column].isna().all():
         # Calculate KDE
         kde_x = np.linspace(df[column].min(), df[column].max(), 1000)
-        kde = gaussian_kde(df[column].dropna())
-        kde_y = kde(kde_x)
+        samples = df[column].dropna().to_numpy()
+        kde = gaussian_kde(samples)
+        kde_y = _binned_kde_1d(samples, kde_x, kde.covariance[0, 0])
         
         # Add KDE curve
         fig.add_trace(go.Scatter(
@@ -36,12 +36,13 @@ Example Usage:
     print(zh.in_zone('cir',(7,5)))   # True
 
 Dependencies:
-    pip install shapely
+    pip install "shapely>=2.0"
 """
 
 import re
 import ast
 import json
+import shapely
 from shapely.geometry import Polygon, Point
 
 class ZonesHandler:
@@ -66,6 +67,18 @@ class ZonesHandler:
         - get_bounds(name)       Return bounding box (minx, miny, maxx, maxy).
     """
 
+    # Map operation symbol to Shapely function
+    _OP_MAP = {
+        'U': shapely.union,
+        'I': shapely.intersection,
+        '-': shapely.difference,
+        '^': shapely.symmetric_difference,
+    }
+
+    # Regex for assignment and set-operation expressions, compiled once
+    _ASSIGN_RE = re.compile(r'^(\w+)\s*=\s*(.+)$')
+    _OP_RE     = re.compile(r'^(\w+)\s*([UI\-\^])\s*(\w+)$')
+
     def __init__(self, code_str: str, circle_resolution: int = 64):
         """
         Initialize the handler and parse DSL.
@@ -79,18 +92,10 @@ class ZonesHandler:
         """
         self.zones = {}
         self._circle_res = circle_resolution
-
-        # Map operation symbol to Shapely method
-        op_map = {
-            'U': lambda A, B: A.union(B),
-            'I': lambda A, B: A.intersection(B),
-            '-': lambda A, B: A.difference(B),
-            '^': lambda A, B: A.symmetric_difference(B),
-        }
-
-        # Regex for assignment and set-operation expressions
-        assign_re = re.compile(r'^(\w+)\s*=\s*(.+)$')
-        op_re     = re.compile(r'^(\w+)\s*([UI\-\^])\s*(\w+)$')
+        # Zones already prepared for point queries, see _prepared_zone()
+        self._prepared = set()
+        # (area, perimeter, bounds) per zone, see _zone_metrics()
+        self._metrics = {}
 
         for idx, raw in enumerate(code_str.strip().splitlines(), 1):
             # strip comments and whitespace
@@ -98,7 +103,7 @@ class ZonesHandler:
             if not line:
                 continue
 
-            m = assign_re.match(line)
+            m = self._ASSIGN_RE.match(line)
             if not m:
                 raise ValueError(f"Syntax error on line {idx}: {line!r}")
 
@@ -119,7 +124,7 @@ class ZonesHandler:
 
             # Set operation
             else:
-                m2 = op_re.match(expr)
+                m2 = self._OP_RE.match(expr)
                 if not m2:
                     raise ValueError(f"Invalid expression for '{name}' on line {idx}: {expr!r}")
 
@@ -129,11 +134,28 @@ class ZonesHandler:
                 if right not in self.zones:
                     raise ValueError(f"Unknown zone '{right}' referenced on line {idx}")
 
-                result = op_map[op](self.zones[left], self.zones[right])
+                result = self._apply_op(op, self.zones[left], self.zones[right])
                 if result.is_empty:
                     raise ValueError(f"Resulting zone '{name}' is empty on line {idx}")
                 self.zones[name] = result
 
+    def _apply_op(self, op: str, A, B):
+        """
+        Apply a set operation, skipping the GEOS overlay for zones whose
+        bounding boxes do not overlap (the result is then known directly).
+        """
+        a, b = A.bounds, B.bounds
+        disjoint = a[2] < b[0] or b[2] < a[0] or a[3] < b[1] or b[3] < a[1]
+        areal = ('Polygon', 'MultiPolygon')
+        if disjoint and A.geom_type in areal and B.geom_type in areal:
+            if op in ('U', '^'):
+                return shapely.multipolygons(shapely.get_parts([A, B]))
+            if op == '-':
+                return A
+            if op == 'I':
+                return Polygon()
+        return self._OP_MAP[op](A, B)
+
     def _parse_coords(self, expr: str, name: str, idx: int):
         """
         Safely parse a list/tuple literal of 2-tuples.
@@ -170,10 +192,45 @@ class ZonesHandler:
         circ = Point(cx, cy).buffer(r, resolution=self._circle_res)
         return circ
 
-    def in_zone(self, zone_name: str, pt: tuple) -> bool:
+    def _prepared_zone(self, zone_name: str):
+        """
+        Return the zone geometry, prepared for repeated point queries.
+
+        Preparing builds GEOS' spatial index of the zone on first use; later
+        predicate calls on the geometry reuse it. Zones do not change after
+        parsing, so the index never goes stale.
+        """
         if zone_name not in self.zones:
             raise KeyError(f"Zone '{zone_name}' not found")
-        return self.zones[zone_name].covers(Point(pt))
+        geom = self.zones[zone_name]
+        if zone_name not in self._prepared:
+            shapely.prepare(geom)
+            self._prepared.add(zone_name)
+        return geom
+
+    def _zone_metrics(self, zone_name: str) -> tuple:
+        """
+        Return (area, perimeter, bounds) of a zone, computed once per zone.
+
+        Shapely computes these in GEOS on every access; zones do not change
+        after parsing, so the values are kept.
+        """
+        metrics = self._metrics.get(zone_name)
+        if metrics is None:
+            if zone_name not in self.zones:
+                raise KeyError(f"Zone '{zone_name}' not found")
+            geom = self.zones[zone_name]
+            metrics = self._metrics[zone_name] = (geom.area, geom.length, geom.bounds)
+        return metrics
+
+    def in_zone(self, zone_name: str, pt: tuple) -> bool:
+        # Points outside the bounding box (or NaN) cannot be in the zone
+        minx, miny, maxx, maxy = self._zone_metrics(zone_name)[2]
+        if not (minx <= pt[0] <= maxx and miny <= pt[1] <= maxy):
+            return False
+        # For a point, intersecting the zone is the same as being covered by
+        # it, and the coordinates are tested without creating a Point
+        return bool(shapely.intersects_xy(self._prepared_zone(zone_name), pt[0], pt[1]))
 
     def get_zones(self) -> list:
         """
@@ -195,9 +252,7 @@ class ZonesHandler:
         Raises:
             KeyError: if zone_name not defined.
         """
-        if zone_name not in self.zones:
-            raise KeyError(f"Zone '{zone_name}' not found")
-        return self.zones[zone_name].area
+        return self._zone_metrics(zone_name)[0]
 
     def get_perimeter(self, zone_name: str) -> float:
         """
@@ -208,9 +263,7 @@ class ZonesHandler:
         Returns:
             float
         """
-        if zone_name not in self.zones:
-            raise KeyError(f"Zone '{zone_name}' not found")
-        return self.zones[zone_name].length
+        return self._zone_metrics(zone_name)[1]
 
     def get_bounds(self, zone_name: str) -> tuple:
         """
@@ -221,9 +274,7 @@ class ZonesHandler:
         Returns:
             (minx, miny, maxx, maxy)
         """
-        if zone_name not in self.zones:
-            raise KeyError(f"Zone '{zone_name}' not found")
-        return self.zones[zone_name].bounds
+        return self._zone_metrics(zone_name)[2]
 
 
 if __name__ == "__main__":